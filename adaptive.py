@@ -0,0 +1,135 @@
+import itertools
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from sweep import Progress, make_pool, run_chunk, run_record, sample_parameters, sweep_state
+
+
+def interval_width(values, confidence=0.95):
+    """
+    Width of the Student t confidence interval on the mean of values,
+    infinite with fewer than two values.
+    """
+    n = len(values)
+    if n < 2:
+        return np.inf
+    return 2 * stats.t.ppf((1 + confidence) / 2, n - 1) * np.std(values, ddof=1) / np.sqrt(n)
+
+
+def replicates_needed(values, width, confidence=0.95):
+    """
+    Estimates the number of replicates whose confidence interval on the mean
+    has the given width, from the spread of the values so far.
+    """
+    n = len(values)
+    if n < 2:
+        return 2
+    scale = 2 * stats.t.ppf((1 + confidence) / 2, n - 1) * np.std(values, ddof=1)
+    return int(np.ceil((scale / width) ** 2)) if width > 0 else np.inf
+
+
+def run_adaptive(model_cls, problem, param_values, model_reporters, target_widths, min_replicates=5,
+                 max_replicates=100, max_steps=50, integer_params=(), fixed_parameters=None, seed=0,
+                 confidence=0.95, processes=None, progress=True, store=None, common_random_numbers=False,
+                 cache=None):
+    """
+    Runs every sample of a SALib problem until the confidence intervals on
+    the means of the outputs in target_widths are at most as wide as their
+    targets, or it has max_replicates runs. Every sample gets min_replicates
+    runs first, after which each round adds runs to the samples that have
+    not converged: as many as the spread of their outputs so far suggests
+    they need, but at most as many as they have, so a noisy early estimate
+    cannot spend the budget at once. Samples with little variance stop
+    after a handful of runs.
+
+    Runs are numbered and seeded like run_sweep, so they are the same runs
+    a sweep with the same seed would make, and a store can be shared with
+    run_sweep: stored runs are reused instead of run again.
+
+    Args:
+        model_cls, problem, param_values, model_reporters, max_steps,
+        integer_params, fixed_parameters, seed, processes, progress, store,
+        common_random_numbers, cache: as for run_sweep
+        target_widths (dict): width of the confidence interval to reach for
+            each output, e.g. {'Percentage lost': 2}
+        min_replicates (int): runs of every sample before checking
+        max_replicates (int): largest number of runs of a sample
+        confidence (float): confidence level of the intervals
+
+    Returns:
+        a DataFrame with one row per sample: its parameters, the number of
+        replicates run and the mean and confidence interval width of every
+        reporter, and a DataFrame of all runs in the layout of run_sweep
+    """
+    state = sweep_state(model_cls, problem, param_values, model_reporters, max_steps, integer_params,
+                        fixed_parameters, seed, common_random_numbers, cache)
+    samples = len(state['param_values'])
+    columns = list(problem['names']) + ['Run'] + sorted(model_reporters)
+
+    # the records of every sample by replicate
+    results = [{} for _ in range(samples)]
+    if store is not None:
+        for record in store.to_dataframe().to_dict('records'):
+            results[int(record['sample'])][int(record['replicate'])] = record
+
+    def values(sample, output):
+        return np.array([results[sample][replicate][output] for replicate in sorted(results[sample])], dtype=float)
+
+    def converged(sample):
+        return all(interval_width(values(sample, output), confidence) <= width
+                   for (output, width) in target_widths.items())
+
+    def wanted(sample):
+        """
+        Number of runs to add to a sample in this round.
+        """
+        n = len(results[sample])
+        if n >= max_replicates or (n >= min_replicates and converged(sample)):
+            return 0
+        if n < min_replicates:
+            return min_replicates - n
+        needed = max(replicates_needed(values(sample, output), width, confidence)
+                     for (output, width) in target_widths.items())
+        return int(min(max(needed - n, 1), n, max_replicates - n))
+
+    processes = processes or multiprocessing.cpu_count()
+    with make_pool(state, processes) as pool:
+        while True:
+            runs = []
+            for sample in range(samples):
+                free = (replicate for replicate in itertools.count() if replicate not in results[sample])
+                runs.extend(replicate * samples + sample for replicate in itertools.islice(free, wanted(sample)))
+            if not runs:
+                break
+
+            chunksize = max(1, min(100, len(runs) // (processes * 4)))
+            chunks = [runs[start:start + chunksize] for start in range(0, len(runs), chunksize)]
+            tracker = Progress(len(runs)) if progress else None
+
+            records = []
+            for chunk_results in pool.imap_unordered(run_chunk, chunks):
+                records.extend(run_record(state, run, reports) for (run, reports) in chunk_results)
+                if tracker:
+                    tracker.update(len(chunk_results))
+
+            if store is not None:
+                store.append(records)
+            for record in records:
+                results[record['sample']][record['replicate']] = record
+
+    summary = []
+    for sample in range(samples):
+        row = sample_parameters(problem, state['param_values'], state['integer_params'], sample)
+        row['sample'] = sample
+        row['Replicates'] = len(results[sample])
+        for output in sorted(model_reporters):
+            row[output] = values(sample, output).mean()
+            row[output + ' width'] = interval_width(values(sample, output), confidence)
+        summary.append(row)
+
+    records = [record for replicates in results for record in replicates.values()]
+    data = pd.DataFrame(sorted(records, key=lambda record: record['Run']), columns=columns)
+    return pd.DataFrame(summary), data.reset_index(drop=True)
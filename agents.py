@@ -1,6 +1,5 @@
 from mesa import Agent
 from utils import rgb_to_hex
-import random
 from math import sin, cos, pi, e
 
 
@@ -8,10 +7,36 @@ class Tree(Agent):
     def __init__(self, unique_id, model, pos, density):
         super().__init__(unique_id, model)
 
-        self.on_fire = False
+        self._on_fire = False
         self.pos = pos
 
-        self.density = density
+        self._density = density
+
+    @property
+    def on_fire(self):
+        return self._on_fire
+
+    @on_fire.setter
+    def on_fire(self, on_fire):
+        """
+        Keep the running burning count of the model up to date.
+        """
+        if on_fire != self._on_fire:
+            self._on_fire = on_fire
+            self.model.tree_fire_changed(self)
+
+    @property
+    def density(self):
+        return self._density
+
+    @density.setter
+    def density(self, density):
+        """
+        Keep the running total density of the model up to date.
+        """
+        old_density = self._density
+        self._density = density
+        self.model.tree_density_changed(self, old_density)
 
     def step(self):
         """
@@ -21,7 +46,7 @@ class Tree(Agent):
         if self.on_fire:
             for neighbor in self.model.grid.neighbor_iter(self.pos, moore=True):
                 if type(neighbor) is Tree and not neighbor.on_fire:
-                    if random.random() < neighbor.density * self.model.fire_spread_param:
+                    if self.model.random.random() < neighbor.density * self.model.fire_spread_param:
                         neighbor.on_fire = True
             
             # burn down
@@ -47,6 +72,8 @@ class FireFighter(Agent):
 
     extinguish = "extinguish"
     firelines = "firelines"
+    nearest = "nearest"
+    firelines_batch = "firelines_batch"
 
     def __init__(self, unique_id, model, pos, strategy):
         super().__init__(unique_id, model)
@@ -60,6 +87,10 @@ class FireFighter(Agent):
             self.extinguish_only()
         elif self.strategy == FireFighter.firelines:
             self.firelines_only()
+        elif self.strategy == FireFighter.nearest:
+            self.extinguish_nearest()
+        elif self.strategy == FireFighter.firelines_batch:
+            self.firelines_batch_only()
 
     # def burn_down_only(self):
     #     # teleport to tree with highest density
@@ -93,72 +124,48 @@ class FireFighter(Agent):
     #         if type(agent) is Tree and agent.density > 0.25:
     #             self.cut_down_tree(agent, 0.2)
 
-    def iter_fireline_coords(self):
-        (l, r, t, b) = self.model.get_fire_edges()
-        margin = self.model.fire_line_margin
-        
-        left = max(l - margin, 0)
-        right = min(r + margin, self.model.width - 1)
-        top = max(t - margin, 0)
-        bottom = min(b + margin, self.model.height - 1)
-
-        # left
-        column = self.model.grid[left]
-        for coord in column[top: bottom]:
-            yield coord
-        
-        # right
-        column = self.model.grid[right]
-        for coord in column[top: bottom + 1]:
-            yield coord
-        
-        # top
-        for column in self.model.grid[left: right]:
-            yield column[top]
-
-        #bottom
-        for column in self.model.grid[left: right]:
-            yield column[bottom]
-        
-    
     def firelines_only(self):
         if self.model.get_number_on_fire() == 0:
             return
 
-        max_density = 0
-        max_pos = (0, 0)
-        max_tree = None
-        for agents in self.iter_fireline_coords():
-            for agent in agents:
-                if type(agent) is Tree:
-                    if agent.density > max_density:
-                        max_density = agent.density
-                        max_pos = agent.pos
-                        max_tree = agent
-        
-        self.model.grid.move_agent(self, max_pos)
-
-        if max_tree is not None:
-            self.cut_down_tree(max_tree, self.model.cut_down_amount)
-        else:
-            self.model.calculate_fire_edges()
+        # the densest tree on the fireline
+        self.cut_fireline(self.model.get_fireline().best())
+
+    def firelines_batch_only(self):
+        if self.model.get_number_on_fire() == 0:
+            return
+
+        # the firefighters of a step cut different trees
+        self.cut_fireline(self.model.get_fireline_target())
+
+    def cut_fireline(self, pos):
+        if pos is None:
+            self.model.grid.move_agent(self, (0, 0))
+            return
+
+        self.model.grid.move_agent(self, pos)
+        self.cut_down_tree(self.model.get_tree(pos), self.model.cut_down_amount)
 
     def extinguish_only(self):
         if self.model.get_number_on_fire() == 0:
             return
 
         # teleport to tree that is on fire
-        new_location = self.pos
-        coords = [coord for coord in self.model.grid.coord_iter()]
-        random.shuffle(coords)
-        for (agents, x, y) in coords:
-            if FireFighter not in [type(agent) for agent in agents]:
-                for agent in agents:
-                    if type(agent) is Tree and agent.on_fire:
-                        new_location = (x, y)
-            if new_location != self.pos:
-                break
-        self.model.grid.move_agent(self, new_location)
+        new_location = self.model.fire_front.random_cell(exclude=self.model.has_firefighter,
+                                                         random=self.model.firefighter_random)
+        if new_location is not None:
+            self.model.grid.move_agent(self, new_location)
+
+        self.extinguish_trees(self.pos, radius=0)
+
+    def extinguish_nearest(self):
+        if self.model.get_number_on_fire() == 0:
+            return
+
+        # teleport to the closest tree that is on fire
+        new_location = self.model.fire_front.nearest_cell(self.pos, exclude=self.model.has_firefighter)
+        if new_location is not None:
+            self.model.grid.move_agent(self, new_location)
 
         self.extinguish_trees(self.pos, radius=0)
 
@@ -210,7 +217,8 @@ class FireFighter(Agent):
     def extinguish_trees(self, pos, radius=1):
         for agent in self.model.grid.get_neighbors(pos, moore=True, radius=radius, include_center=True):
             if type(agent) is Tree and agent.on_fire:
-                if random.betavariate(1, self.model.extinguish_difficulty) * self.model.max_density > agent.density:
+                chance = self.model.firefighter_random.betavariate(1, self.model.extinguish_difficulty)
+                if chance * self.model.max_density > agent.density:
                     agent.on_fire = False
                     self.model.extinguish_cost += 1
 
@@ -0,0 +1,204 @@
+import contextlib
+import functools
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from template import LandscapeTemplate
+
+try:
+    import fcntl
+except ImportError:
+    # without fcntl (on Windows) eviction is not locked, writes stay atomic
+    fcntl = None
+
+# modules whose code decides the outputs of a run
+model_modules = ['model', 'agents', 'engine', 'schedule', 'firefront', 'fireline', 'dispatch', 'landscape',
+                 'decomposition', 'sequential', 'template', 'terrain', 'recorder', 'snapshot']
+
+
+@functools.lru_cache()
+def code_version(modules=tuple(model_modules)):
+    """
+    Hash of the source of the model modules, so results of older code are
+    not reused.
+    """
+    digest = hashlib.sha256()
+    for name in modules:
+        with open(importlib.util.find_spec(name).origin, 'rb') as f:
+            digest.update(name.encode() + b'\0' + f.read())
+    return digest.hexdigest()
+
+
+def canonical(value):
+    """
+    JSON representation of an argument, with arrays by the hash of their
+    contents, templates by their landscape and classes by name. Other
+    objects have no stable representation and raise a TypeError, rather
+    than being keyed by something like their address.
+    """
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return {'array': hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest(),
+                'dtype': str(value.dtype), 'shape': value.shape}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for (key, item) in value.items()}
+    if isinstance(value, LandscapeTemplate):
+        return {'template': canonical({'density': np.asarray(value.density), 'terrain': np.asarray(value.terrain),
+                                       'ignition': value.ignition, 'parameters': value.parameters})}
+    if isinstance(value, type):
+        return f'{value.__module__}.{value.__qualname__}'
+    raise TypeError(f"cannot key a run by an argument of type {type(value).__name__}")
+
+
+class ResultCache:
+    """
+    Cache of the reports of model runs in a directory, shared by sweeps and
+    scripts, so runs that were done before are never repeated. An entry is
+    keyed by a hash of all arguments of the model class, its seed, the
+    number of steps and the code version of the model modules; reports are
+    stored by reporter name, so reporters with the same name must report the
+    same thing.
+
+    Entries are written to a temporary file and renamed, so processes can
+    share a cache without locking and never see partial entries. Reading an
+    entry touches it, and once the cache grows beyond max_bytes the least
+    recently used entries are deleted, by one process at a time. The size is
+    checked every check_every writes, so it may overshoot by that many
+    entries per process.
+    """
+
+    def __init__(self, path, max_bytes=2 ** 30, version=None, check_every=100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version if version is not None else code_version()
+        self.check_every = check_every
+        self.writes = 0
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, model_cls, parameters, seed, steps):
+        """
+        Hash of a run, with parameters completed by the defaults of
+        model_cls so equivalent runs share a key.
+        """
+        arguments = inspect.signature(model_cls).bind(**parameters)
+        arguments.apply_defaults()
+        arguments = {name: value for (name, value) in arguments.arguments.items() if name != 'seed'}
+        description = {'model': f'{model_cls.__module__}.{model_cls.__qualname__}',
+                       'parameters': canonical(arguments),
+                       'seed': canonical(seed),
+                       'steps': steps,
+                       'version': self.version}
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], key + '.npz')
+
+    def read(self, key):
+        try:
+            with np.load(self.entry_path(key)) as entry:
+                reports = {name: entry[name] for name in entry.files}
+        except (FileNotFoundError, EOFError):
+            return {}
+        return {name: value.item() if value.ndim == 0 else value for (name, value) in reports.items()}
+
+    def get(self, key, names):
+        """
+        Returns the reports of a run by name, or None unless all names are
+        stored.
+        """
+        reports = self.read(key)
+        if not all(name in reports for name in names):
+            return None
+
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(self.entry_path(key))
+        return {name: reports[name] for name in names}
+
+    def put(self, key, reports):
+        """
+        Stores the reports of a run, along with those stored before.
+        """
+        reports = dict(self.read(key), **reports)
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        (handle, temporary) = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+        with os.fdopen(handle, 'wb') as f:
+            np.savez(f, **{name: np.asarray(value) for (name, value) in reports.items()})
+        os.replace(temporary, path)
+
+        self.writes += 1
+        if self.writes % self.check_every == 0:
+            self.evict()
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Holds the eviction lock, yields False if another process has it.
+        """
+        if fcntl is None:
+            yield True
+            return
+
+        with open(os.path.join(self.path, 'lock'), 'w') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def entries(self):
+        """
+        Returns (mtime, size, path) of every entry.
+        """
+        entries = []
+        for shard in os.scandir(self.path):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.npz'):
+                    with contextlib.suppress(FileNotFoundError):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for (_, size, _) in self.entries())
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits in
+        max_bytes, unless another process is evicting already.
+        """
+        with self.lock() as locked:
+            if not locked:
+                return
+
+            entries = sorted(self.entries())
+            total = sum(size for (_, size, _) in entries)
+            for (_, size, path) in entries:
+                if total <= self.max_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                total -= size
+
+    def clear(self):
+        for (_, _, path) in self.entries():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
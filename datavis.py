@@ -1,13 +1,25 @@
+import os
 import pickle
-from SALib.analyze import sobol
 import matplotlib.pyplot as plt
 from itertools import combinations
 import numpy as np
 
+from sensitivity import IncrementalSobol
+from store import ResultStore
+
 plt.rcParams['figure.figsize'] = 7, 5
 
-data_fireline = pickle.load(open("data_fireline.p", "rb"))
-data_ext = pickle.load(open("data_ext.p", "rb"))
+def analyze(name, problem, output='Percentage lost'):
+    """
+    Sobol indices of one output of a sweep, read from its result store, or
+    from the pickled DataFrame of sweeps that were run before the store existed.
+    """
+    sobol = IncrementalSobol(problem, output)
+    if os.path.isdir(name):
+        sobol.update_from_store(ResultStore(name))
+    else:
+        sobol.add_values(pickle.load(open(name + ".p", "rb"))[output].to_numpy())
+    return sobol.analyze(print_to_console=True)
 
 def plot_index(s, params, i, title='', filename=''):
     """
@@ -56,8 +68,8 @@ problem_ext = {
     'bounds': [[0.003, 0.006], [1, 20], [1, 5], [1, 5]]
 }
 
-Si_fireline = sobol.analyze(problem_fireline, data_fireline['Percentage lost'].as_matrix(), print_to_console=True)
-Si_ext = sobol.analyze(problem_ext, data_ext['Percentage lost'].as_matrix(), print_to_console=True)
+Si_fireline = analyze("data_fireline", problem_fireline)
+Si_ext = analyze("data_ext", problem_ext)
 
 # First order
 plot_index(Si_fireline, problem_fireline['names'], '1', 'First order sensitivity_fireline', 'FOSfirelines.png')
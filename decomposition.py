@@ -0,0 +1,203 @@
+import multiprocessing
+import os
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from engine import ArrayForest, FireSpread
+
+
+def open_shared(name, dtype, shape):
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def stripe_worker(connection, arrays, shape, owned, fire_spread_param):
+    """
+    Main loop of a worker process, which spreads the fire within its own
+    stripe of the grid and is the only process that writes its cells.
+    """
+    (width, height) = shape
+    (density_memory, density) = open_shared(*arrays[0], shape)
+    (on_fire_memory, on_fire) = open_shared(*arrays[1], shape)
+    (density, on_fire) = (density.reshape(-1), on_fire.reshape(-1))
+
+    fire_spread = None
+    while True:
+        message = connection.recv()
+        command = message[0]
+
+        if command == 'spread':
+            rng = np.random.default_rng(message[2])
+            fire_spread = FireSpread(density, on_fire, message[1], width, height, fire_spread_param, owned, rng)
+            fire_spread.run()
+            connection.send(fire_spread.outgoing)
+        elif command == 'receive':
+            fire_spread.receive(*message[1:])
+            fire_spread.run()
+            connection.send(fire_spread.outgoing)
+        elif command == 'finish':
+            (still_burning, _, burnt, lost) = fire_spread.finish()
+            fire_spread = None
+            connection.send((still_burning, burnt, lost))
+        elif command == 'extinguish':
+            (cells, chance) = message[1:]
+            success = on_fire[cells] & (chance > density[cells])
+            extinguished = np.unique(cells[success])
+            on_fire[extinguished] = False
+            connection.send(extinguished)
+        elif command == 'cut_down':
+            (cell, amount) = message[1:]
+            density[cell] -= amount
+            connection.send(None)
+        elif command == 'close':
+            break
+
+    del density, on_fire
+    density_memory.close()
+    on_fire_memory.close()
+    connection.close()
+
+
+def close_workers(owner, connections, processes, memories):
+    # forked processes inherit the finalizer, only the process that started
+    # the workers may stop them
+    if os.getpid() != owner:
+        return
+    for connection in connections:
+        try:
+            connection.send(('close',))
+        except (BrokenPipeError, OSError):
+            pass
+    for process in processes:
+        process.join()
+    for memory in memories:
+        memory.close()
+        memory.unlink()
+
+
+class StripedForest(ArrayForest):
+    """
+    ArrayForest that spreads the fire of one landscape with several worker
+    processes. The grid is cut into stripes along the x (axis 0) or y (axis
+    1) axis, and every stripe is owned by a worker that spreads the fire
+    within it. Density and burning state are in shared memory, so workers
+    read the one cell wide halo around their stripe directly, and ignitions
+    of halo cells are passed on to the worker that owns them until the fire
+    stops spreading in every stripe. Only the owner of a cell writes it, so
+    the firefighters' extinguishing and cutting are routed to the owner as
+    well.
+
+    Since activation times are only compared within a step, this gives the
+    same outcomes as ArrayForest, whatever the number of stripes.
+    """
+
+    def __init__(self, model, stripes=2, axis=0):
+        super().__init__(model)
+
+        self.axis = axis
+        size = (model.width, model.height)[axis]
+        self.stripes = max(1, min(stripes, size))
+        self.bounds = np.linspace(0, size, self.stripes + 1).astype(int)
+
+        self.connections = []
+        self.memories = []
+        self.finalizer = None
+
+    def init_forest(self):
+        super().init_forest()
+
+        # move the landscape to shared memory, then start a worker per stripe
+        self.density = self.share(self.density)
+        self.on_fire = self.share(self.on_fire)
+
+        arrays = [(memory.name, array.dtype) for (memory, array) in zip(self.memories, (self.density, self.on_fire))]
+        context = multiprocessing.get_context()
+        processes = []
+        for stripe in range(self.stripes):
+            (connection, worker_connection) = context.Pipe()
+            owned = (self.axis, self.bounds[stripe], self.bounds[stripe + 1])
+            process = context.Process(target=stripe_worker, daemon=True,
+                                      args=(worker_connection, arrays,
+                                            self.density.shape, owned, self.model.fire_spread_param))
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            processes.append(process)
+
+        self.finalizer = weakref.finalize(self, close_workers, os.getpid(), self.connections, processes,
+                                          self.memories)
+
+    def share(self, array):
+        memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.memories.append(memory)
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+        shared[...] = array
+        return shared
+
+    def owners(self, cells):
+        (xs, ys) = np.unravel_index(cells, self.on_fire.shape)
+        return np.searchsorted(self.bounds, (xs, ys)[self.axis], side='right') - 1
+
+    def request(self, messages):
+        """
+        Sends a message to every worker with one and returns their replies.
+        """
+        for stripe, message in messages.items():
+            self.connections[stripe].send(message)
+        return {stripe: self.connections[stripe].recv() for stripe in messages}
+
+    def spread(self):
+        # every worker draws from a Generator of its own, spawned from the
+        # spread stream of the model every step, so snapshots of the model
+        # cover the workers' random state too
+        seeds = np.random.SeedSequence(self.model.rng.integers(2 ** 32)).spawn(self.stripes)
+
+        owners = self.owners(self.burning)
+        outgoing = self.request({stripe: ('spread', self.burning[owners == stripe], seeds[stripe])
+                                 for stripe in range(self.stripes)})
+
+        # pass ignitions of halo cells on until the fire stops spreading
+        while any(len(targets) for (targets, _) in outgoing.values()):
+            targets = np.concatenate([targets for (targets, _) in outgoing.values()])
+            times = np.concatenate([times for (_, times) in outgoing.values()])
+            owners = self.owners(targets)
+            outgoing = self.request({stripe: ('receive', targets[owners == stripe], times[owners == stripe])
+                                     for stripe in np.unique(owners)})
+
+        results = self.request({stripe: ('finish',) for stripe in range(self.stripes)})
+        (burning, burnt, lost) = (np.concatenate(parts) for parts in zip(*(results[stripe]
+                                                                          for stripe in range(self.stripes))))
+        self.burning = np.sort(burning)
+        return (burnt, lost)
+
+    def extinguish_at_firefighters(self, acting=None):
+        model = self.model
+        number = len(self.firefighters)
+
+        cells = self.firefighter_cells()
+        chance = model.firefighter_rng.beta(1, model.extinguish_difficulty, number) * model.max_density
+        if acting is not None:
+            (cells, chance) = (cells[acting], chance[acting])
+
+        owners = self.owners(cells)
+        results = self.request({stripe: ('extinguish', cells[owners == stripe], chance[owners == stripe])
+                                for stripe in np.unique(owners)})
+
+        extinguished = np.sort(np.concatenate([np.zeros(0, dtype=int)] + list(results.values())))
+        self.burning = np.setdiff1d(self.burning, extinguished, assume_unique=True)
+        model.extinguish_cost += len(extinguished)
+
+    def cut_down(self, x, y, amount):
+        cell = np.ravel_multi_index((x, y), self.on_fire.shape)
+        self.request({int(self.owners(cell)): ('cut_down', cell, amount)})
+
+    def close(self):
+        """
+        Stops the workers and frees the shared memory. The arrays are copied
+        out first, so the final state can still be read.
+        """
+        if self.finalizer is not None and self.finalizer.alive:
+            (self.density, self.on_fire) = (self.density.copy(), self.on_fire.copy())
+            self.finalizer()
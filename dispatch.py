@@ -0,0 +1,96 @@
+import numpy as np
+
+from agents import FireFighter
+
+
+def travel_distance(positions, targets):
+    """
+    Number of steps between every position and every target, moving to any
+    of the eight neighbouring cells per step.
+    """
+    return np.abs(positions[:, None, :] - targets[None, :, :]).max(axis=-1)
+
+
+def assign(positions, targets, rng=np.random):
+    """
+    Assigns every firefighter a different target, greedily matching the
+    closest firefighter and target first, with ties in a random order.
+    Returns the index of the target of every firefighter, -1 for those left
+    without one.
+    """
+    number = len(positions)
+    assignment = np.full(number, -1)
+    if not number or not len(targets):
+        return assignment
+
+    # firefighters lose at most number - 1 targets to the others, so only
+    # their closest number targets can be picked
+    order = rng.permutation(number)
+    distance = travel_distance(positions[order], targets)
+    closest = min(number, len(targets))
+    candidates = np.argpartition(distance, closest - 1, axis=1)[:, :closest]
+    costs = np.take_along_axis(distance, candidates, axis=1)
+
+    taken = np.zeros(len(targets), dtype=bool)
+    assigned = 0
+    for flat in np.argsort(costs, axis=None, kind='stable'):
+        (i, j) = divmod(flat, closest)
+        target = candidates[i, j]
+        if assignment[order[i]] < 0 and not taken[target]:
+            assignment[order[i]] = target
+            taken[target] = True
+            assigned += 1
+            if assigned == closest:
+                break
+    return assignment
+
+
+class Dispatcher:
+    """
+    Directs all firefighters once per step instead of letting every
+    FireFighter pick its own target. The candidate targets are the burning
+    trees for the extinguishing strategies, and the densest trees on the
+    fireline for the fireline strategies, candidates per firefighter. Every
+    firefighter gets a different target, the closest ones first, see assign.
+
+    Without max_move firefighters teleport to their targets like the
+    FireFighter strategies. Otherwise they walk at most max_move cells per
+    step towards their targets and only extinguish or cut once they are
+    there.
+    """
+
+    def __init__(self, model, max_move=None, candidates=2):
+        self.model = model
+        self.max_move = max_move
+        self.candidates = candidates
+
+    def step(self):
+        model = self.model
+        if model.get_number_on_fire() == 0:
+            return
+
+        positions = model.get_firefighter_positions()
+        extinguishing = model.firefighter_strategy in (FireFighter.extinguish, FireFighter.nearest)
+        if extinguishing:
+            targets = model.get_burning_positions()
+        else:
+            targets = np.array(model.get_fireline().take(self.candidates * len(positions)), dtype=int).reshape(-1, 2)
+        if not len(targets):
+            return
+
+        assignment = assign(positions, targets, model.firefighter_rng)
+        moving = assignment >= 0
+        destinations = positions.copy()
+        destinations[moving] = targets[assignment[moving]]
+
+        if self.max_move is None:
+            arrived = moving
+        else:
+            destinations = positions + np.clip(destinations - positions, -self.max_move, self.max_move)
+            arrived = moving & np.all(destinations == targets[np.maximum(assignment, 0)], axis=1)
+
+        model.set_firefighter_positions(destinations)
+        if extinguishing:
+            model.extinguish_at_firefighters(arrived)
+        else:
+            model.cut_down_at_firefighters(arrived)
@@ -0,0 +1,362 @@
+import numpy as np
+
+from agents import FireFighter
+from firefront import FireFront
+from terrain import DIRT
+
+
+# Offsets of the Moore neighbourhood, as used by Tree.step
+MOORE = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)]
+
+
+def spread(density, on_fire, fire_spread_param, rng=np.random):
+    """
+    Tree.step for the whole grid at once. Every tree gets a random activation
+    time within the step, which gives the same outcomes as activating the
+    trees in random order: a burning tree tries to ignite its neighbours with
+    probability density * fire_spread_param when it is activated, so a tree
+    that catches fire before its own activation time spreads the fire further
+    in the same step. The grid is not a torus.
+
+    The arrays are updated in place. The last two axes are the grid, so a
+    stack of grids can be passed as well, and fire_spread_param may be an
+    array that broadcasts to them.
+
+    Random numbers are drawn from rng, a NumPy Generator or the global
+    random state. Returns a boolean array with the trees that caught fire.
+    """
+    (width, height) = on_fire.shape[-2:]
+    if np.ndim(fire_spread_param):
+        fire_spread_param = np.broadcast_to(fire_spread_param, on_fire.shape).ravel()
+
+    burning = np.flatnonzero(on_fire)
+    (_, ignited, _, _) = spread_cells(density.reshape(-1), on_fire.reshape(-1), burning,
+                                      width, height, fire_spread_param, rng)
+
+    caught_fire = np.zeros(on_fire.shape, dtype=bool)
+    caught_fire.reshape(-1)[ignited] = True
+    return caught_fire
+
+
+def spread_cells(density, on_fire, burning, width, height, fire_spread_param, rng=np.random):
+    """
+    Sparse core of spread. density and on_fire are flat arrays holding one or
+    more (width, height) grids, burning holds the sorted flat indices of the
+    burning cells, and fire_spread_param is a number or a flat array with a
+    value per cell. Only the burning cells and their neighbours are read or
+    written, so the arrays can also be memory-mapped.
+
+    Returns the sorted flat indices of the cells that burn after the step, of
+    the trees that caught fire, of the trees that burnt down, and the density
+    those trees lost.
+    """
+    fire_spread = FireSpread(density, on_fire, burning, width, height, fire_spread_param, rng=rng)
+    fire_spread.run()
+    return fire_spread.finish()
+
+
+class FireSpread:
+    """
+    One step of spread_cells, which can be run in parts. When only the cells
+    of a stripe of the grid are owned, given as (axis, start, stop) of the
+    owned coordinates, ignitions of cells outside it are collected in
+    outgoing instead, so they can be passed on to the owner of those cells
+    with receive.
+    """
+
+    def __init__(self, density, on_fire, burning, width, height, fire_spread_param, owned=None, rng=np.random):
+        self.density = density
+        self.on_fire = on_fire
+        self.burning = burning
+        self.width = width
+        self.height = height
+        self.fire_spread_param = fire_spread_param
+        self.owned = owned
+        self.rng = rng
+
+        self.offsets = np.array([dx * height + dy for (dx, dy) in MOORE])
+        self.moore = np.array(MOORE)
+
+        # activation and ignition times of the cells the fire reached so far,
+        # activation times are only drawn for those
+        self.cells = burning
+        self.activation = rng.random(len(burning))
+        self.ignition = np.full(len(burning), np.inf)
+        self.active = np.ones(len(burning), dtype=bool)
+
+        self.sources = np.arange(len(burning))
+        self.outgoing = None
+
+    def run(self):
+        """
+        Spreads the fire until it stops within the owned cells. Ignitions of
+        other cells found on the way are left in outgoing.
+        """
+        outgoing = [(np.zeros(0, dtype=int), np.zeros(0))]
+        while len(self.sources):
+            # every source tries to ignite each neighbour once, when it is activated
+            sources = self.cells[self.sources]
+            x = (sources // self.height) % self.width
+            y = sources % self.height
+            inside = ((x[:, None] + self.moore[:, 0] >= 0) & (x[:, None] + self.moore[:, 0] < self.width)
+                      & (y[:, None] + self.moore[:, 1] >= 0) & (y[:, None] + self.moore[:, 1] < self.height))
+            targets = (sources[:, None] + self.offsets)[inside]
+            times = np.broadcast_to(self.activation[self.sources][:, None], inside.shape)[inside]
+
+            density = self.density[targets]
+            p = self.fire_spread_param[targets] if np.ndim(self.fire_spread_param) else self.fire_spread_param
+            caught = ~self.on_fire[targets] & (density > 0) & (self.rng.random(len(targets)) < density * p)
+            (targets, times) = (targets[caught], times[caught])
+
+            if self.owned is not None:
+                own = self.owns(targets)
+                outgoing.append((targets[~own], times[~own]))
+                (targets, times) = (targets[own], times[own])
+
+            self.receive(targets, times)
+
+        self.outgoing = (np.concatenate([targets for (targets, _) in outgoing]),
+                         np.concatenate([times for (_, times) in outgoing]))
+
+    def owns(self, cells):
+        (axis, start, stop) = self.owned
+        coordinate = (cells // self.height) % self.width if axis == 0 else cells % self.height
+        return (coordinate >= start) & (coordinate < stop)
+
+    def receive(self, targets, times):
+        """
+        Ignites owned cells at the given times, and makes the ones that catch
+        fire before their own activation time sources of further spread.
+        """
+        # a tree catches fire at the activation time of the first neighbour that ignites it
+        (targets, inverse) = np.unique(targets, return_inverse=True)
+        first = np.full(len(targets), np.inf)
+        np.minimum.at(first, inverse, times)
+
+        new = np.setdiff1d(targets, self.cells, assume_unique=True)
+        if len(new):
+            order = np.argsort(np.concatenate([self.cells, new]), kind='stable')
+            self.cells = np.concatenate([self.cells, new])[order]
+            self.activation = np.concatenate([self.activation, self.rng.random(len(new))])[order]
+            self.ignition = np.concatenate([self.ignition, np.full(len(new), np.inf)])[order]
+            self.active = np.concatenate([self.active, np.zeros(len(new), dtype=bool)])[order]
+
+        reached = np.searchsorted(self.cells, targets)
+        self.ignition[reached] = np.minimum(self.ignition[reached], first)
+
+        # trees that catch fire before their own activation time spread it in this step
+        sources = reached[~self.active[reached] & (self.ignition[reached] < self.activation[reached])]
+        self.active[sources] = True
+        self.sources = sources
+
+    def finish(self):
+        """
+        Burns down the trees that were activated while on fire and sets the
+        new burning state. Returns the same as spread_cells.
+        """
+        ignited = self.cells[np.isfinite(self.ignition)]
+        burnt = self.cells[self.active]
+        still_burning = self.cells[np.isfinite(self.ignition) & ~self.active]
+
+        # burn down
+        lost = self.density[burnt]
+        self.density[burnt] = 0
+        self.on_fire[self.burning] = False
+        self.on_fire[still_burning] = True
+
+        return (still_burning, ignited, burnt, lost)
+
+
+class ArrayForest:
+    """
+    Array backed replacement for RandomActivationForestFire. Tree density and
+    burning state are stored as (width, height) arrays indexed like the grid,
+    and the firefighters as an array of positions. The flat indices of the
+    burning cells are kept as well, so spreading and fighting the fire only
+    visits the fire and its surroundings.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+        # set up by init_forest
+        self.density = None
+        self.on_fire = None
+        self.burning = np.zeros(0, dtype=int)
+        self.firefighters = np.zeros((0, 2), dtype=int)
+
+        self.steps = 0
+
+    def init_forest(self):
+        model = self.model
+
+        # trees grow on dirt
+        forest = model.terrain == DIRT
+        self.density = model.init_density()
+        model.total_trees = np.count_nonzero(forest)
+
+        self.on_fire = np.zeros((model.width, model.height), dtype=bool)
+        if model.get_ignition() is not None:
+            self.ignite(np.ravel_multi_index(model.get_ignition(), forest.shape))
+        elif model.total_trees:
+            cells = np.flatnonzero(forest)
+            self.ignite(cells[model.ignition_rng.integers(len(cells))])
+
+        model.initial_total_density = self.get_total_density()
+        self.init_firefighters()
+
+    def init_firefighters(self):
+        model = self.model
+        self.firefighters = model.draw_firefighter_positions()
+
+    def ignite(self, cell):
+        self.on_fire.reshape(-1)[cell] = True
+        self.burning = np.union1d(self.burning, [cell])
+
+    def restore(self, density, burning, firefighters):
+        self.density[...] = density
+        self.on_fire[...] = False
+        self.on_fire.reshape(-1)[burning] = True
+        self.burning = np.sort(burning)
+        self.firefighters = np.array(firefighters, dtype=int).reshape(-1, 2)
+
+    def step(self, activate_firefighters=True):
+        self.spread()
+
+        if activate_firefighters:
+            if self.model.firefighter_strategy == FireFighter.extinguish:
+                self.extinguish()
+            elif self.model.firefighter_strategy in (FireFighter.firelines, FireFighter.firelines_batch):
+                self.firelines()
+            elif self.model.firefighter_strategy == FireFighter.nearest:
+                self.extinguish_nearest()
+
+        self.steps += 1
+
+    def spread(self):
+        """
+        Spreads the fire, returns the flat indices of the trees that burnt
+        down and the density they lost.
+        """
+        (self.burning, _, burnt, lost) = spread_cells(self.density.reshape(-1), self.on_fire.reshape(-1), self.burning,
+                                                      self.model.width, self.model.height, self.model.fire_spread_param,
+                                                      self.model.rng)
+        return (burnt, lost)
+
+    def firefighter_cells(self):
+        return np.ravel_multi_index((self.firefighters[:, 0], self.firefighters[:, 1]), self.on_fire.shape)
+
+    def extinguish(self):
+        """
+        Every firefighter teleports to a different burning cell without a
+        firefighter on it and tries to extinguish it, see
+        FireFighter.extinguish_only.
+        """
+        if not len(self.burning):
+            return
+
+        number = len(self.firefighters)
+        candidates = self.burning[~np.isin(self.burning, self.firefighter_cells())]
+
+        # firefighters that find no free burning cell stay where they are
+        rng = self.model.firefighter_rng
+        movers = rng.permutation(number)[:min(number, len(candidates))]
+        targets = rng.choice(candidates, size=len(movers), replace=False)
+        self.firefighters[movers] = np.column_stack(np.unravel_index(targets, self.on_fire.shape))
+
+        self.extinguish_at_firefighters()
+
+    def extinguish_nearest(self):
+        """
+        Every firefighter in turn teleports to the closest burning cell
+        without a firefighter on it, see FireFighter.extinguish_nearest.
+        """
+        if not len(self.burning):
+            return
+
+        burning = np.column_stack(np.unravel_index(self.burning, self.on_fire.shape))
+        occupied = np.isin(self.burning, self.firefighter_cells())
+
+        for i in range(len(self.firefighters)):
+            if occupied.all():
+                break
+            free = np.flatnonzero(~occupied)
+
+            delta = np.abs(burning[free] - self.firefighters[i])
+            distance = delta.max(axis=1) * (2 * max(self.on_fire.shape) ** 2) + (delta ** 2).sum(axis=1)
+            nearest = free[np.argmin(distance)]
+
+            occupied[np.all(burning == self.firefighters[i], axis=1)] = False
+            occupied[nearest] = True
+            self.firefighters[i] = burning[nearest]
+
+        self.extinguish_at_firefighters()
+
+    def extinguish_at_firefighters(self, acting=None):
+        """
+        Every firefighter, or those set in acting, tries to extinguish the
+        tree it stands on.
+        """
+        model = self.model
+        number = len(self.firefighters)
+
+        xs, ys = self.firefighters[:, 0], self.firefighters[:, 1]
+        chance = model.firefighter_rng.beta(1, model.extinguish_difficulty, number) * model.max_density
+        success = self.on_fire[xs, ys] & (chance > self.density[xs, ys])
+        if acting is not None:
+            success &= acting
+
+        extinguished = np.unique(np.ravel_multi_index((xs[success], ys[success]), self.on_fire.shape))
+        self.on_fire.reshape(-1)[extinguished] = False
+        self.burning = np.setdiff1d(self.burning, extinguished, assume_unique=True)
+        model.extinguish_cost += len(extinguished)
+
+    def firelines(self):
+        """
+        Every firefighter in turn cuts down the densest tree on the fireline,
+        see FireFighter.firelines_only, or with the firelines_batch strategy
+        the firefighters cut the densest trees, one each.
+        """
+        if not len(self.burning):
+            return
+
+        model = self.model
+
+        # cutting trees does not change the fire, so the fireline stays put
+        fireline = model.get_fireline()
+        if model.firefighter_strategy == FireFighter.firelines_batch:
+            targets = fireline.take(len(self.firefighters))
+
+        for i in range(len(self.firefighters)):
+            if model.firefighter_strategy == FireFighter.firelines_batch:
+                target = targets[i] if i < len(targets) else None
+            else:
+                target = fireline.best()
+
+            if target is not None:
+                self.firefighters[i] = target
+                self.cut_down(*target, min(model.cut_down_amount, self.density[target]))
+                model.cut_down_cost += 1
+            else:
+                self.firefighters[i] = (0, 0)
+
+    def cut_down(self, x, y, amount):
+        self.density[x, y] -= amount
+
+    def get_fire_edges(self):
+        if not len(self.burning):
+            return (self.model.width, 0, self.model.height, 0)
+        (xs, ys) = np.unravel_index(self.burning, self.on_fire.shape)
+        return (int(xs.min()), int(xs.max()), int(ys.min()), int(ys.max()))
+
+    def get_fire_boxes(self, gap):
+        fire_front = FireFront(self.model.width, self.model.height)
+        for (x, y) in zip(*np.unravel_index(self.burning, self.on_fire.shape)):
+            fire_front.add((int(x), int(y)))
+        return fire_front.get_boxes(gap)
+
+    def get_total_density(self):
+        return self.density.sum()
+
+    def get_number_on_fire(self):
+        return len(self.burning)
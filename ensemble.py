@@ -0,0 +1,191 @@
+import numpy as np
+
+from agents import FireFighter
+from engine import spread
+from terrain import DIRT, dirt, load_terrain
+
+
+class Ensemble:
+    """
+    A number of independent forest fires, advanced together as stacked
+    (members, width, height) arrays. Every member can have its own value for
+    the parameters below, given either as a single value for all members or
+    as one value per member. The other parameters mean the same as for
+    ForestFire, and the fire spreads as in the array engine. All members share
+    the terrain raster, if one is given. Only the extinguish and firelines
+    firefighter strategies are supported.
+    """
+
+    # parameters that may differ per member, with the defaults of ForestFire
+    parameters = {"fire_spread_param": 0.0045,
+                  "number_firefighters": 10,
+                  "extinguish_difficulty": 3,
+                  "fire_line_margin": 5,
+                  "cut_down_amount": 250,
+                  "firefighter_response_delay": 1}
+
+    def __init__(self, members, height=50, width=50,
+                 initial_density_dist_alpha=1.5, initial_density_dist_beta=10, max_density=555,
+                 firefighter_strategy=FireFighter.extinguish, terrain=None, seed=None, **parameters):
+
+        unknown = set(parameters) - set(Ensemble.parameters)
+        if unknown:
+            raise TypeError(f"unknown ensemble parameters: {', '.join(sorted(unknown))}")
+
+        self.terrain = dirt(width, height) if terrain is None else load_terrain(terrain)
+        (width, height) = self.terrain.shape
+
+        self.members = members
+        self.rng = np.random.default_rng(seed)
+        self.height = height
+        self.width = width
+        self.max_density = max_density
+        if firefighter_strategy not in (FireFighter.extinguish, FireFighter.firelines):
+            raise ValueError(f"unsupported strategy {firefighter_strategy!r}")
+        self.firefighter_strategy = firefighter_strategy
+
+        for name, default in Ensemble.parameters.items():
+            values = np.broadcast_to(np.asarray(parameters.get(name, default)), (members,))
+            setattr(self, name, values.copy())
+        self.number_firefighters = self.number_firefighters.astype(int)
+
+        # trees grow on dirt
+        forest = self.terrain == DIRT
+        self.density = self.rng.beta(initial_density_dist_alpha, initial_density_dist_beta,
+                                      (members, width, height)) * max_density * forest
+        self.initial_total_density = self.density.sum(axis=(1, 2))
+
+        self.on_fire = np.zeros((members, width, height), dtype=bool)
+        ignition = self.rng.choice(np.flatnonzero(forest), members)
+        self.on_fire.reshape(members, -1)[np.arange(members), ignition] = True
+
+        # firefighter slots beyond number_firefighters of a member are unused
+        slots = self.number_firefighters.max(initial=0)
+        self.firefighters = np.stack([self.rng.integers(0, width, (members, slots)),
+                                      self.rng.integers(0, height, (members, slots))], axis=-1)
+        self.in_use = np.arange(slots) < self.number_firefighters[:, None]
+
+        self.extinguish_cost = np.zeros(members, dtype=int)
+        self.cut_down_cost = np.zeros(members, dtype=int)
+        self.burnout_time = np.zeros(members, dtype=int)
+
+        self.steps = 0
+
+    def step(self):
+        spread(self.density, self.on_fire, self.fire_spread_param[:, None, None], self.rng)
+
+        # like ForestFire.step, firefighters start after the response delay and
+        # only act while there is a fire
+        acting = (self.steps > self.firefighter_response_delay) & self.on_fire.any(axis=(1, 2))
+        if acting.any():
+            if self.firefighter_strategy == FireFighter.extinguish:
+                self.extinguish(acting)
+            elif self.firefighter_strategy == FireFighter.firelines:
+                self.firelines(acting)
+
+        self.burnout_time += self.on_fire.any(axis=(1, 2))
+        self.steps += 1
+
+    def extinguish(self, acting):
+        """
+        Every acting firefighter teleports to a different burning cell without
+        a firefighter on it and tries to extinguish it.
+        """
+        members = np.arange(self.members)[:, None]
+        slots = self.firefighters.shape[1]
+        if slots == 0:
+            return
+        using = self.in_use & acting[:, None]
+
+        occupied = np.zeros(self.on_fire.shape, dtype=bool)
+        occupied[np.broadcast_to(members, using.shape)[using], self.firefighters[using][:, 0], self.firefighters[using][:, 1]] = True
+
+        # a random score per free burning cell, the highest scores are the targets
+        free = (self.on_fire & ~occupied).reshape(self.members, -1)
+        scores = np.where(free, self.rng.random(free.shape), -1)
+        if slots < scores.shape[1]:
+            best = np.argpartition(-scores, slots - 1, axis=1)[:, :slots]
+        else:
+            best = np.argsort(-scores, axis=1)
+        found = np.take_along_axis(scores, best, axis=1) >= 0
+
+        # firefighters that find no free burning cell stay where they are
+        moving = using & found
+        (xs, ys) = np.unravel_index(best, (self.width, self.height))
+        self.firefighters[moving] = np.stack([xs[moving], ys[moving]], axis=-1)
+
+        (xs, ys) = (self.firefighters[..., 0], self.firefighters[..., 1])
+        chance = self.rng.beta(1, self.extinguish_difficulty[:, None], using.shape) * self.max_density
+        success = using & self.on_fire[members, xs, ys] & (chance > self.density[members, xs, ys])
+
+        cells = np.unique(np.ravel_multi_index((np.broadcast_to(members, success.shape)[success], xs[success], ys[success]),
+                                               self.on_fire.shape))
+        self.on_fire.flat[cells] = False
+        self.extinguish_cost += np.bincount(cells // (self.width * self.height), minlength=self.members)
+
+    def firelines(self, acting):
+        """
+        Every acting firefighter in turn cuts down the densest tree on the
+        fireline around the fire of its member.
+        """
+        members = np.arange(self.members)
+        margin = self.fire_line_margin.astype(int)
+
+        columns = self.on_fire.any(axis=2)
+        rows = self.on_fire.any(axis=1)
+        left = np.maximum(columns.argmax(axis=1) - margin, 0)
+        right = np.minimum(self.width - 1 - columns[:, ::-1].argmax(axis=1) + margin, self.width - 1)
+        top = np.maximum(rows.argmax(axis=1) - margin, 0)
+        bottom = np.minimum(self.height - 1 - rows[:, ::-1].argmax(axis=1) + margin, self.height - 1)
+
+        x = np.arange(self.width)[None, :, None]
+        y = np.arange(self.height)[None, None, :]
+        (left, right, top, bottom) = (edge[:, None, None] for edge in (left, right, top, bottom))
+        inside_x = (x >= left) & (x <= right)
+        inside_y = (y >= top) & (y <= bottom)
+        fireline = (((x == left) | (x == right)) & inside_y) | (((y == top) | (y == bottom)) & inside_x)
+
+        for slot in range(self.firefighters.shape[1]):
+            using = self.in_use[:, slot] & acting
+            if not using.any():
+                break
+
+            densities = np.where(fireline, self.density, 0).reshape(self.members, -1)
+            best = densities.argmax(axis=1)
+            cutting = using & (densities[members, best] > 0)
+            (xs, ys) = np.unravel_index(best, (self.width, self.height))
+
+            self.density[members[cutting], xs[cutting], ys[cutting]] -= np.minimum(
+                self.cut_down_amount[cutting], densities[members[cutting], best[cutting]])
+            self.cut_down_cost += cutting
+
+            # like firelines_only, firefighters without a tree to cut go to the corner
+            self.firefighters[using, slot] = np.where(cutting[using, None],
+                                                      np.stack([xs[using], ys[using]], axis=-1), 0)
+
+    def percentage_lost(self):
+        return (1 - self.density.sum(axis=(1, 2)) / self.initial_total_density) * 100
+
+    def run(self, steps):
+        """
+        Runs the ensemble for a number of steps. Returns a dictionary with the
+        "Percentage lost" and "Burnout time" of every member after every step
+        as (members, steps + 1) arrays, the first column being the start.
+        """
+        percentage_lost = np.zeros((self.members, steps + 1))
+        burnout_time = np.zeros((self.members, steps + 1), dtype=int)
+
+        percentage_lost[:, 0] = self.percentage_lost()
+        burnout_time[:, 0] = self.burnout_time
+        for t in range(1, steps + 1):
+            if not self.on_fire.any():
+                # every fire is out, nothing changes any more
+                percentage_lost[:, t:] = percentage_lost[:, t - 1:t]
+                burnout_time[:, t:] = burnout_time[:, t - 1:t]
+                break
+
+            self.step()
+            percentage_lost[:, t] = self.percentage_lost()
+            burnout_time[:, t] = self.burnout_time
+
+        return {"Percentage lost": percentage_lost, "Burnout time": burnout_time}
@@ -0,0 +1,163 @@
+from collections import deque
+import random
+
+
+class FireFront:
+    """
+    The burning cells of the forest and their extent. The model updates it
+    whenever a tree catches fire or stops burning, so the edges of the fire
+    are always current without scanning the grid.
+
+    The cells are kept in a list with an index per position, so burning cells
+    can be sampled and searched in time that depends on the size of the fire
+    rather than the size of the grid.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        self.cells = []
+        self.index = {}
+
+        # number of burning cells per column and per row
+        self.columns = [0] * width
+        self.rows = [0] * height
+
+        # bounds that may still be too wide after cells burn out, they are
+        # tightened when the edges are asked for
+        self.min_x = width
+        self.max_x = -1
+        self.min_y = height
+        self.max_y = -1
+
+        # the boxes of the last get_boxes call and their gap, until a cell
+        # catches fire or burns out
+        self.boxes = None
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, pos):
+        return pos in self.index
+
+    def add(self, pos):
+        (x, y) = pos
+        self.index[pos] = len(self.cells)
+        self.cells.append(pos)
+        self.boxes = None
+        self.columns[x] += 1
+        self.rows[y] += 1
+
+        self.min_x = min(self.min_x, x)
+        self.max_x = max(self.max_x, x)
+        self.min_y = min(self.min_y, y)
+        self.max_y = max(self.max_y, y)
+
+    def remove(self, pos):
+        (x, y) = pos
+
+        # move the last cell into the gap
+        i = self.index.pop(pos)
+        self.boxes = None
+        last = self.cells.pop()
+        if last != pos:
+            self.cells[i] = last
+            self.index[last] = i
+
+        self.columns[x] -= 1
+        self.rows[y] -= 1
+
+    def get_edges(self):
+        """
+        Returns (min_x, max_x, min_y, max_y) of the burning cells, or
+        (width, 0, height, 0) if nothing burns, like ForestFire.scan_fire_edges.
+        """
+        if not self.cells:
+            self.min_x, self.max_x, self.min_y, self.max_y = self.width, -1, self.height, -1
+            return (self.width, 0, self.height, 0)
+
+        while self.columns[self.min_x] == 0:
+            self.min_x += 1
+        while self.columns[self.max_x] == 0:
+            self.max_x -= 1
+        while self.rows[self.min_y] == 0:
+            self.min_y += 1
+        while self.rows[self.max_y] == 0:
+            self.max_y -= 1
+
+        return (self.min_x, self.max_x, self.min_y, self.max_y)
+
+    def random_cell(self, exclude=None, tries=8, random=random):
+        """
+        Returns a uniformly chosen burning cell for which exclude(pos) is
+        False, or None if there is no such cell. Draws from the given
+        random.Random, the global one by default.
+        """
+        if not self.cells:
+            return None
+
+        # most of the fire is usually free, so try a few cells first
+        for _ in range(tries):
+            pos = random.choice(self.cells)
+            if exclude is None or not exclude(pos):
+                return pos
+
+        cells = list(self.cells)
+        random.shuffle(cells)
+        for pos in cells:
+            if not exclude(pos):
+                return pos
+        return None
+
+    def nearest_cell(self, pos, exclude=None):
+        """
+        Returns the burning cell closest to pos, counted in moves between
+        Moore neighbours, for which exclude(pos) is False. Ties go to the
+        cell closest as the crow flies. Returns None if there is no such cell.
+        """
+        (x, y) = pos
+        nearest = None
+        nearest_distance = None
+        for cell in self.cells:
+            (dx, dy) = (abs(cell[0] - x), abs(cell[1] - y))
+            distance = (max(dx, dy), dx * dx + dy * dy)
+            if (nearest_distance is None or distance < nearest_distance) and (exclude is None or not exclude(cell)):
+                nearest = cell
+                nearest_distance = distance
+        return nearest
+
+    def get_boxes(self, gap=0):
+        """
+        Returns the edges of every separate fire. Burning cells belong to the
+        same fire if they are at most gap cells apart, with gap=0 meaning
+        Moore neighbours. The boxes are kept until the fire changes, so asking
+        for them once per firefighter costs a single search.
+        """
+        if self.boxes is not None and self.boxes[0] == gap:
+            return list(self.boxes[1])
+
+        reach = gap + 1
+        unvisited = set(self.cells)
+        boxes = []
+        while unvisited:
+            start = unvisited.pop()
+            (min_x, max_x, min_y, max_y) = (start[0], start[0], start[1], start[1])
+
+            queue = deque([start])
+            while queue:
+                (x, y) = queue.popleft()
+                min_x, max_x = min(min_x, x), max(max_x, x)
+                min_y, max_y = min(min_y, y), max(max_y, y)
+
+                for dx in range(-reach, reach + 1):
+                    for dy in range(-reach, reach + 1):
+                        neighbor = (x + dx, y + dy)
+                        if neighbor in unvisited:
+                            unvisited.remove(neighbor)
+                            queue.append(neighbor)
+
+            boxes.append((min_x, max_x, min_y, max_y))
+
+        self.boxes = (gap, boxes)
+        return list(boxes)
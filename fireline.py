@@ -0,0 +1,93 @@
+from heapq import heapify, heappop, heappush
+
+import numpy as np
+
+
+def fireline_coords(edges, margin, width, height):
+    """
+    Coordinates of the fireline margin cells around the fire edges: the left
+    and right columns, then the top and bottom rows.
+    """
+    (l, r, t, b) = edges
+    left = max(l - margin, 0)
+    right = min(r + margin, width - 1)
+    top = max(t - margin, 0)
+    bottom = min(b + margin, height - 1)
+
+    xs = np.concatenate([np.full(max(bottom - top, 0), left),
+                         np.full(max(bottom + 1 - top, 0), right),
+                         np.arange(left, right),
+                         np.arange(left, right)])
+    ys = np.concatenate([np.arange(top, bottom),
+                         np.arange(top, bottom + 1),
+                         np.full(max(right - left, 0), top),
+                         np.full(max(right - left, 0), bottom)])
+    return xs.astype(int), ys.astype(int)
+
+
+class FirelineIndex:
+    """
+    The cells of the fireline around a set of fire boxes in a heap keyed by
+    density, so the densest tree on the fireline is found without scanning
+    it. Densities are read with get_density(pos) when cells are pushed.
+    Trees only ever lose density, so an entry is at worst an overestimate:
+    entries whose density changed are only corrected once they reach the
+    top. The index is built for fixed boxes and is rebuilt by the model
+    when the fire edges change.
+
+    Of cells with the same density, the one that comes first on the fireline
+    is picked, like scanning the fireline in order.
+    """
+
+    def __init__(self, boxes, margin, width, height, get_density):
+        self.boxes = boxes
+        self.get_density = get_density
+
+        order = {}
+        for edges in boxes:
+            for (x, y) in zip(*fireline_coords(edges, margin, width, height)):
+                order.setdefault((int(x), int(y)), len(order))
+
+        self.heap = [(-get_density(pos), i, pos) for (pos, i) in order.items()]
+        self.heap = [entry for entry in self.heap if entry[0] < 0]
+        heapify(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def top(self):
+        """
+        Corrects outdated entries until the one on top is current.
+        """
+        while self.heap:
+            (key, i, pos) = self.heap[0]
+            density = self.get_density(pos)
+            if density == -key:
+                return self.heap[0]
+
+            heappop(self.heap)
+            if density > 0:
+                heappush(self.heap, (-density, i, pos))
+        return None
+
+    def best(self):
+        """
+        Returns the position of the densest tree on the fireline, or None if
+        there are no trees left on it.
+        """
+        entry = self.top()
+        return entry[2] if entry is not None else None
+
+    def take(self, number):
+        """
+        Returns the positions of the number densest trees on the fireline,
+        densest first, or fewer if there are not as many trees left on it.
+        """
+        taken = []
+        while len(taken) < number and self.top() is not None:
+            taken.append(heappop(self.heap))
+
+        # put them back, cutting them makes them outdated
+        for entry in taken:
+            heappush(self.heap, entry)
+        return [pos for (_, _, pos) in taken]
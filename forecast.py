@@ -0,0 +1,108 @@
+import collections
+
+import numpy as np
+
+from engine import MOORE
+
+FireForecast = collections.namedtuple('FireForecast', ['burn_probability', 'arrival_time'])
+
+def neighbour_table(width, height):
+    """
+    Flat indices of the neighbours of every cell, one column per direction
+    of MOORE, -1 where a neighbour is outside the grid.
+    """
+    (x, y) = np.divmod(np.arange(width * height), height)
+    table = np.full((width * height, len(MOORE)), -1)
+    for (direction, (dx, dy)) in enumerate(MOORE):
+        valid = (x + dx >= 0) & (x + dx < width) & (y + dy >= 0) & (y + dy < height)
+        table[valid, direction] = (x[valid] + dx) * height + y[valid] + dy
+    return table
+
+
+def mix(x):
+    """
+    The splitmix64 finaliser, scrambles the bits of uint64 values.
+    """
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def hashed_uniform(key, *values):
+    """
+    Uniform numbers in [0, 1) that are a fixed function of key and values,
+    so the same random number can be drawn again wherever it is needed.
+    """
+    with np.errstate(over='ignore'):
+        h = np.uint64(key)
+        for value in values:
+            h = mix(h ^ mix(np.asarray(value).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)))
+    return (h >> np.uint64(11)).astype(float) * 2.0 ** -53
+
+
+def sample_spread(density, burning, fire_spread_param, samples=200, steps=None, seed=None):
+    """
+    Monte Carlo estimate of the fire without firefighters, much faster than
+    running the model. A burning tree tries once to ignite every neighbour,
+    so which trees burn depends only on which of these tries succeed, and
+    every sample draws them all at once. The time a tree catches fire is
+    the shortest path from the burning trees, where a tree passes the fire
+    on at its first activation after it caught fire, with an activation
+    time per tree and step drawn as in the model. These samples have the
+    distribution of runs of the model, but are computed as shortest paths
+    over all samples at once, only revisiting trees whose time changed.
+
+    Returns a FireForecast with the probability that every cell burns within
+    steps steps, by default at all, and the expected step in which it
+    catches fire if it does, 0 for the burning cells and NaN for cells that
+    never burnt.
+    """
+    (width, height) = density.shape
+    cells = width * height
+    probability = np.minimum(np.asarray(density, dtype=float).ravel() * fire_spread_param, 1)
+    neighbours = neighbour_table(width, height)
+    directions = np.arange(len(MOORE))
+
+    (edge_key, activation_key) = np.random.SeedSequence(seed).generate_state(2, np.uint64)
+
+    times = np.full(samples * cells, np.inf)
+    burning = np.asarray(burning, dtype=int)
+    changed = (np.arange(samples)[:, None] * cells + burning[None, :]).ravel()
+    times[changed] = 0
+    marked = np.zeros(samples * cells, dtype=bool)
+
+    while len(changed):
+        (sample, cell) = np.divmod(changed, cells)
+
+        # the first activation of every changed tree after it caught fire
+        time = times[changed]
+        step = np.floor(time)
+        activation = hashed_uniform(activation_key, changed, step)
+        passed_on = np.where(activation > time - step, step + activation,
+                             step + 1 + hashed_uniform(activation_key, changed, step + 1))
+        if steps is not None:
+            # trees that catch fire after the last step do not matter
+            passed_on[passed_on >= steps] = np.inf
+
+        # every try of the changed trees to ignite their neighbours, each
+        # drawn once per sample
+        targets = neighbours[cell]
+        draws = hashed_uniform(edge_key, changed[:, None] * len(MOORE) + directions)
+        caught = (targets >= 0) & (draws < probability[targets])
+        tried = (sample[:, None] * cells + targets)[caught]
+        candidates = np.broadcast_to(passed_on[:, None], caught.shape)[caught]
+
+        earlier = candidates < times[tried]
+        (tried, candidates) = (tried[earlier], candidates[earlier])
+        np.minimum.at(times, tried, candidates)
+        marked[tried] = True
+        changed = np.flatnonzero(marked)
+        marked[changed] = False
+
+    times = times.reshape(samples, width, height)
+    burnt = np.isfinite(times)
+    step = np.where(times > 0, np.floor(np.where(burnt, times, 0)) + 1, 0)
+    burn_probability = burnt.mean(axis=0)
+    with np.errstate(invalid='ignore'):
+        arrival = np.where(burnt, step, 0).sum(axis=0) / burnt.sum(axis=0)
+    return FireForecast(burn_probability, arrival)
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+
+from engine import ArrayForest
+from template import draw_density
+from terrain import DIRT
+
+
+def remove_landscape(owner, path):
+    # forked processes inherit the finalizer, only the process that created
+    # the directory removes it
+    if os.getpid() == owner:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class TiledForest(ArrayForest):
+    """
+    ArrayForest for landscapes that do not fit in memory. Density, burning
+    state and terrain are memory-mapped files in a directory, and the fire is
+    only ever read and written around its burning cells, so only the pages of
+    the tiles near the fire front are paged in. The grid is divided into
+    square tiles with a summary of the density per tile, from which the
+    grid-wide statistics are computed without touching the landscape.
+
+    Without a path the files go to a temporary directory, which is removed by
+    close or once the forest is garbage collected. A given path is kept.
+    """
+
+    def __init__(self, model, path=None, tile_size=256):
+        super().__init__(model)
+
+        if path is None:
+            self.path = tempfile.mkdtemp(prefix='forestfire-')
+            self.finalizer = weakref.finalize(self, remove_landscape, os.getpid(), self.path)
+        else:
+            self.path = path
+            self.finalizer = None
+            os.makedirs(self.path, exist_ok=True)
+        self.tile_size = tile_size
+
+        tiles = (-(-model.width // tile_size), -(-model.height // tile_size))
+        self.tile_density = np.zeros(tiles)
+        self.tile_trees = np.zeros(tiles, dtype=int)
+
+    def open(self, name, dtype, mode='w+'):
+        return np.memmap(os.path.join(self.path, name + '.dat'), dtype=dtype, mode=mode,
+                         shape=(self.model.width, self.model.height))
+
+    def iter_tiles(self):
+        for tx in range(self.tile_density.shape[0]):
+            for ty in range(self.tile_density.shape[1]):
+                yield (tx, ty), (slice(tx * self.tile_size, (tx + 1) * self.tile_size),
+                                 slice(ty * self.tile_size, (ty + 1) * self.tile_size))
+
+    def init_forest(self):
+        model = self.model
+
+        # without a terrain raster the model leaves it to the engine, a new
+        # file reads as zeros, which is dirt everywhere
+        if model.terrain is None:
+            model.terrain = self.open('terrain', np.uint8)
+
+        self.density = self.open('density', np.float32)
+        self.on_fire = self.open('on_fire', bool)
+
+        # fill the landscape one tile at a time, trees grow on dirt
+        for tile, cells in self.iter_tiles():
+            forest = model.terrain[cells] == DIRT
+            if model.template is not None:
+                density = model.template.density[cells]
+            else:
+                density = draw_density(model.initial_density_dist_alpha, model.initial_density_dist_beta,
+                                       model.max_density, forest, model.landscape_rng)
+            self.density[cells] = density
+            self.tile_density[tile] = density.sum()
+            self.tile_trees[tile] = np.count_nonzero(forest)
+        model.total_trees = self.tile_trees.sum()
+
+        # start the fire at a random tree: pick a tile by its number of trees
+        if model.get_ignition() is not None:
+            self.ignite(np.ravel_multi_index(model.get_ignition(), (model.width, model.height)))
+        elif model.total_trees:
+            tiles = list(self.iter_tiles())
+            (_, cells) = tiles[model.ignition_rng.choice(len(tiles), p=self.tile_trees.ravel() / model.total_trees)]
+            (xs, ys) = np.nonzero(model.terrain[cells] == DIRT)
+            i = model.ignition_rng.integers(len(xs))
+            self.ignite(np.ravel_multi_index((cells[0].start + xs[i], cells[1].start + ys[i]),
+                                             (model.width, model.height)))
+
+        model.initial_total_density = self.get_total_density()
+        self.init_firefighters()
+
+    def restore(self, density, burning, firefighters):
+        super().restore(density, burning, firefighters)
+        for tile, cells in self.iter_tiles():
+            self.tile_density[tile] = self.density[cells].sum()
+
+    def tiles_of(self, cells):
+        (xs, ys) = np.unravel_index(cells, (self.model.width, self.model.height))
+        return (xs // self.tile_size, ys // self.tile_size)
+
+    def spread(self):
+        (burnt, lost) = super().spread()
+        np.subtract.at(self.tile_density, self.tiles_of(burnt), lost)
+        return (burnt, lost)
+
+    def cut_down(self, x, y, amount):
+        super().cut_down(x, y, amount)
+        self.tile_density[x // self.tile_size, y // self.tile_size] -= amount
+
+    def get_tile_fire(self):
+        """
+        Number of burning cells per tile.
+        """
+        burning = np.zeros(self.tile_density.shape, dtype=int)
+        np.add.at(burning, self.tiles_of(self.burning), 1)
+        return burning
+
+    def get_total_density(self):
+        return self.tile_density.sum()
+
+    def flush(self):
+        self.density.flush()
+        self.on_fire.flush()
+
+    def close(self):
+        """
+        Removes the temporary directory of the landscape files, if the forest
+        created it.
+        """
+        if self.finalizer is not None:
+            self.finalizer()
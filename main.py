@@ -1,9 +1,11 @@
 from mesa.visualization.modules import CanvasGrid
 from mesa.visualization.ModularVisualization import ModularServer
 from mesa.visualization.modules import ChartModule
+import numpy as np
 
 # Import the implemented classes
 from model import ForestFire
+import terrain
 
 import os
 import sys
@@ -20,8 +22,21 @@ def agent_portrayal(agent):
       return
     return agent.get_portrayal()
 
+class TerrainCanvasGrid(CanvasGrid):
+    """
+    Draws the terrain raster of the model underneath the agents.
+    """
+    def render(self, model):
+        grid_state = super().render(model)
+        for (x, y), kind in np.ndenumerate(model.terrain):
+            portrayal = terrain.get_portrayal(int(kind))
+            portrayal["x"] = int(x)
+            portrayal["y"] = int(y)
+            grid_state[portrayal["Layer"]].append(portrayal)
+        return grid_state
+
 # Create a grid of 20 by 20 cells, and display it as 500 by 500 pixels
-grid = CanvasGrid(agent_portrayal, ForestFire.width, ForestFire.height, 600, 600)
+grid = TerrainCanvasGrid(agent_portrayal, ForestFire.width, ForestFire.height, 600, 600)
 
 # Create a dynamic linegraph
 chart0 = ChartModule([{"Label": "Total cost",
@@ -1,36 +1,86 @@
 from mesa import Model
-from mesa.datacollection import DataCollector
 from mesa.space import MultiGrid
 from mesa.time import RandomActivation
 import random
-from math import pi, sin, cos
+import numpy as np
+from math import pi, sin, cos, isclose
 
 from agents import Tree, FireFighter
-from terrain import Dirt
+from terrain import DIRT, dirt, load_terrain
+from template import draw_density
 from schedule import RandomActivationForestFire
+from engine import ArrayForest
+from landscape import TiledForest
+from decomposition import StripedForest
+from sequential import SequentialForest
+from firefront import FireFront
+from fireline import FirelineIndex
+from dispatch import Dispatcher
+from forecast import sample_spread
+from recorder import ArrayDataCollector
+from snapshot import pack, unpack, pack_random, unpack_random, pack_generator, unpack_generator
+
+
+def python_random(sequence):
+    '''
+    random.Random seeded from a NumPy SeedSequence.
+    '''
+    return random.Random(int.from_bytes(sequence.generate_state(4).tobytes(), "little"))
 
 
 class ForestFire(Model):
+
+    # simulation engines
+    agents = "agents"
+    array = "array"
+    tiled = "tiled"
+    striped = "striped"
+    sequential = "sequential"
     
     width = 50
     height = 50
+
+    # statistics that can be collected every step, from the model and the
+    # grid statistics of get_grid_stats
+    model_reporters = {"Average Density": lambda m, s: s["total_density"] / m.total_trees,
+                       "Total Density": lambda m, s: s["total_density"],
+                       "Percentage lost": lambda m, s: (1 - s["total_density"] / m.initial_total_density) * 100,
+                       "On Fire": lambda m, s: s["number_on_fire"] / m.total_trees,
+                       "Total cost": lambda m, s: m.extinguish_cost + m.burn_cost + m.cut_down_cost,
+                       "Extinguish cost": lambda m, s: m.extinguish_cost,
+                       "Burn cost": lambda m, s: m.burn_cost,
+                       "Cut down cost": lambda m, s: m.cut_down_cost
+                       }
     
     def __init__(self, height=height, width=width,
         initial_density_dist_alpha=1.5, initial_density_dist_beta=10, max_density=555,
         fire_spread_param=0.0045,
         firefighter_strategy=FireFighter.extinguish,
-        number_firefighters=10, extinguish_difficulty=3, fire_line_margin=5, cut_down_amount=250, firefighter_response_delay=1):
+        number_firefighters=10, extinguish_difficulty=3, fire_line_margin=5, cut_down_amount=250, firefighter_response_delay=1,
+        terrain=None, fire_line_gap=None, engine=agents, landscape_path=None, tile_size=256, stripes=2, stripe_axis=0, template=None, schedule_class=RandomActivationForestFire,
+        dispatch=False, max_move=None, seed=None, reporters=None, collect_every=1, debug=False):
 
-        super().__init__()
+        # the arguments, to build copies of the model with fork
+        self.parameters = {name: value for (name, value) in locals().items() if name not in ("self", "__class__")}
 
-        # don't use for simulation
-        # random.seed(0)
+        super().__init__()
+        self.init_random(seed)
 
         self.height = height
         self.width = width
+        self.engine = engine
+        self.template = template
+
         self.initial_density_dist_alpha = initial_density_dist_alpha
         self.initial_density_dist_beta = initial_density_dist_beta
         self.max_density = max_density
+
+        if template is not None:
+            # the landscape and the parameters it was drawn with come from the template
+            terrain = template.terrain
+            for (name, value) in template.parameters.items():
+                setattr(self, name, value)
+        self.init_terrain(terrain)
         
         self.fire_spread_param = fire_spread_param
 
@@ -40,33 +90,56 @@ class ForestFire(Model):
         self.fire_line_margin = fire_line_margin
         self.cut_down_amount = cut_down_amount
         self.firefighter_response_delay = firefighter_response_delay
+        self.fire_line_gap = fire_line_gap
+        self.debug = debug
+
+        # direct all firefighters at once instead of one at a time
+        self.dispatcher = Dispatcher(self, max_move) if dispatch else None
 
         self.fire_edges = None
+        self.fireline = None
+        self.fireline_targets = None
 
         self.extinguish_cost = 0
         self.burn_cost = 0
         self.cut_down_cost = 0
         self.burnout_time = 0
-        
-        self.grid = MultiGrid(self.width, self.height, torus=False)
 
-        self.schedule = RandomActivationForestFire(self)
+        # running aggregates, kept up to date by the trees
+        self.total_density = 0
+        self.number_on_fire = 0
+        self.fire_front = FireFront(self.width, self.height)
+        
+        if self.engine == ForestFire.array:
+            # the array engines keep the whole state and need no grid
+            self.grid = None
+            self.schedule = ArrayForest(self)
+        elif self.engine == ForestFire.tiled:
+            self.grid = None
+            self.schedule = TiledForest(self, landscape_path, tile_size)
+        elif self.engine == ForestFire.striped:
+            self.grid = None
+            self.schedule = StripedForest(self, stripes, stripe_axis)
+        elif self.engine == ForestFire.sequential:
+            self.grid = None
+            self.schedule = SequentialForest(self)
+        else:
+            self.grid = MultiGrid(self.width, self.height, torus=False)
+            self.schedule = schedule_class(self)
 
-        self.datacollector = DataCollector({"Average Density": lambda m: self.get_total_density() / self.total_trees,
-                                            "Total Density": lambda m: self.get_total_density(),
-                                            "Percentage lost": lambda m: self.percentage_lost(),
-                                            "On Fire": lambda m: self.get_number_on_fire() / self.total_trees,
-                                            "Total cost": lambda m: self.extinguish_cost + self.burn_cost + self.cut_down_cost,
-                                            "Extinguish cost": lambda m: self.extinguish_cost,
-                                            "Burn cost": lambda m: self.burn_cost,
-                                            "Cut down cost": lambda m: self.cut_down_cost
-                                            })
+        # collect all statistics unless only some are asked for
+        if reporters is None:
+            reporters = list(ForestFire.model_reporters)
+        self.datacollector = ArrayDataCollector({name: ForestFire.model_reporters[name] for name in reporters},
+                                                ForestFire.get_grid_stats, collect_every)
 
         # Create trees and firefighters
-        self.init_terrain()
         self.total_trees = 0
-        self.init_trees()
-        self.init_firefighters()
+        if self.engine != ForestFire.agents:
+            self.schedule.init_forest()
+        else:
+            self.init_trees()
+            self.init_firefighters()
 
         self.steps = 0
 
@@ -74,36 +147,83 @@ class ForestFire(Model):
         self.running = True
         self.datacollector.collect(self)
 
-    def init_terrain(self):
-        # fill with dirt
-        for (_, x, y) in self.grid.coord_iter():
-            self.grid.place_agent(Dirt(self.next_id(), self), (x, y))
+    def init_random(self, seed):
+        '''
+        Sets up the random streams of the model from one seed, fresh entropy
+        if it is None. The landscape, the ignition, the spread of the fire
+        and the firefighters each draw from a stream of their own, so models
+        with the same seed use the same random numbers for each of them,
+        even if their parameters differ (common random numbers).
+
+        Every stream is a NumPy Generator for the array engines, the spread
+        and firefighter streams are also random.Random instances (random and
+        firefighter_random) for the single draws of the agents.
+        '''
+        self._seed = seed
+        (landscape, ignition, spread, firefighters) = np.random.SeedSequence(seed).spawn(4)
+        self.landscape_rng = np.random.default_rng(landscape)
+        self.ignition_rng = np.random.default_rng(ignition)
+        self.rng = np.random.default_rng(spread)
+        self.firefighter_rng = np.random.default_rng(firefighters)
+        self.random = python_random(spread.spawn(1)[0])
+        self.firefighter_random = python_random(firefighters.spawn(1)[0])
+
+    def init_terrain(self, terrain):
+        '''
+        Sets up the terrain raster, all dirt unless a raster, .npy file or
+        image is given. A given raster sets the size of the grid.
+        '''
+        if terrain is None:
+            # the tiled engine keeps the terrain in a file instead of memory
+            self.terrain = dirt(self.width, self.height) if self.engine != ForestFire.tiled else None
+        else:
+            self.terrain = load_terrain(terrain)
+            (self.width, self.height) = self.terrain.shape
+
+    def init_density(self):
+        '''
+        Returns the initial density of every cell, copied from the template
+        if there is one and drawn otherwise. Cells without trees are zero.
+        '''
+        if self.template is not None:
+            return self.template.get_density()
+        return draw_density(self.initial_density_dist_alpha, self.initial_density_dist_beta, self.max_density,
+                            self.terrain == DIRT, self.landscape_rng)
+
+    def get_ignition(self):
+        '''
+        Returns the position of the tree that catches fire first if the
+        template fixes it, and None if it is drawn at random.
+        '''
+        return self.template.ignition if self.template is not None else None
 
     def init_trees(self):
-        for (agents, x, y) in self.grid.coord_iter():
-            if Dirt in (type(agent) for agent in agents):
-                self.new_tree((x, y), random.betavariate(self.initial_density_dist_alpha, self.initial_density_dist_beta) * self.max_density)
-                self.total_trees += 1
+        # trees grow on dirt
+        forest = [(int(x), int(y)) for (x, y) in np.argwhere(self.terrain == DIRT)]
+        density = self.init_density()
+        for (x, y) in forest:
+            self.new_tree((x, y), float(density[x, y]))
+            self.total_trees += 1
 
-        fire_x = random.randint(0, self.width - 1)
-        fire_y = random.randint(0, self.height - 1)
-        for agent in self.grid[fire_x][fire_y]:
-            if type(agent) is Tree:
-                agent.on_fire = True
+        if forest:
+            self.get_tree(self.get_ignition() or forest[self.ignition_rng.integers(len(forest))]).on_fire = True
 
         self.initial_total_density = self.get_total_density()
 
     def init_firefighters(self):
-        for _ in range(self.number_firefighters):
-            x = random.randint(0, self.width - 1)
-            y = random.randint(0, self.height - 1)
-            self.new_firefighter((x, y))
+        for (x, y) in self.draw_firefighter_positions():
+            self.new_firefighter((int(x), int(y)))
+
+    def draw_firefighter_positions(self):
+        return np.column_stack([self.firefighter_rng.integers(0, self.width, self.number_firefighters),
+                                self.firefighter_rng.integers(0, self.height, self.number_firefighters)])
 
     def new_tree(self, pos, density):
         '''
         Method that creates a new agent, and adds it to the correct scheduler.
         '''
         tree = Tree(self.next_id(), self, pos, density)
+        self.total_density += density
 
         self.grid.place_agent(tree, pos)
         self.schedule.add_tree(tree)
@@ -118,18 +238,41 @@ class ForestFire(Model):
         '''
         Method that calls the step method for each of the sheep, and then for each of the wolves.
         '''
-        if self.schedule.steps > self.firefighter_response_delay:
-            self.schedule.step()
+        activate_firefighters = self.schedule.steps > self.firefighter_response_delay
+        self.schedule.step(activate_firefighters=activate_firefighters and self.dispatcher is None)
+        if activate_firefighters and self.dispatcher is not None:
+            self.dispatcher.step()
+
+        if self.get_number_on_fire() > 0:
+            self.burnout_time += 1
         else:
-            self.schedule.step(activate_firefighters=False)
+            # trees don't regrow, so once the fire is out nothing changes any more
+            self.running = False
 
         # Save the statistics
         self.datacollector.collect(self)
 
-        if self.get_number_on_fire() > 0:
-            self.burnout_time += 1
+    def get_trajectory(self, steps):
+        '''
+        Returns the collected statistics for the start and the given number of
+        steps. Runs that stopped early because the fire went out are filled in
+        with their final values after their last step, which is exactly what
+        further steps would give. Steps that were not collected, with
+        collect_every above 1 or beyond the steps run so far, raise a
+        ValueError.
+        '''
+        data = self.datacollector.get_model_vars_dataframe()
+        trajectory = data.reindex(range(steps + 1))
+        if not self.running:
+            trajectory.loc[data.index[-1]:] = trajectory.loc[data.index[-1]:].ffill()
 
-    def calculate_fire_edges(self):
+        missing = trajectory.index[trajectory.isna().any(axis=1)]
+        if len(missing):
+            raise ValueError(f"steps {list(missing)} were not collected, "
+                             f"collect_every is {self.datacollector.collect_every}")
+        return trajectory
+
+    def scan_fire_edges(self):
         max_x = 0
         min_x = self.width
         max_y = 0
@@ -147,14 +290,102 @@ class ForestFire(Model):
                     if y < min_y:
                         min_y = y
         
-        self.fire_edges = (min_x, max_x, min_y, max_y)
+        return (min_x, max_x, min_y, max_y)
     
     def get_fire_edges(self):
-        if self.fire_edges is None:
-            self.calculate_fire_edges()
+        if self.engine != ForestFire.agents:
+            self.fire_edges = self.schedule.get_fire_edges()
+            return self.fire_edges
+
+        self.fire_edges = self.fire_front.get_edges()
+        if self.debug:
+            scanned = self.scan_fire_edges()
+            assert self.fire_edges == scanned, \
+                f"running fire edges {self.fire_edges} do not match scan {scanned}"
         return self.fire_edges
 
+    def get_fire_boxes(self):
+        '''
+        Returns the edges of every separate fire, where burning trees at most
+        fire_line_gap cells apart belong to the same fire. Without a
+        fire_line_gap the whole fire is one box.
+        '''
+        if self.fire_line_gap is None:
+            return [self.get_fire_edges()]
+
+        if self.engine != ForestFire.agents:
+            return self.schedule.get_fire_boxes(self.fire_line_gap)
+        return self.fire_front.get_boxes(self.fire_line_gap)
+
+    def get_fireline(self):
+        '''
+        Returns the index of the trees on the fireline, which is only
+        rebuilt when the fire boxes changed.
+        '''
+        boxes = self.get_fire_boxes()
+        if self.fireline is None or self.fireline.boxes != boxes:
+            self.fireline = FirelineIndex(boxes, self.fire_line_margin, self.width, self.height, self.get_density)
+        return self.fireline
+
+    def get_fireline_target(self):
+        '''
+        Returns the next target of the firelines_batch strategy. The targets
+        of all firefighters are picked at once at the first call in a step,
+        the densest trees on the fireline, one per firefighter.
+        '''
+        if self.fireline_targets is None or self.fireline_targets[0] != self.schedule.steps:
+            self.fireline_targets = (self.schedule.steps, self.get_fireline().take(self.number_firefighters))
+
+        targets = self.fireline_targets[1]
+        return targets.pop(0) if targets else None
+
+    def get_density(self, pos):
+        if self.engine != ForestFire.agents:
+            return self.schedule.density[pos]
+        tree = self.get_tree(pos)
+        return tree.density if tree is not None else 0
+
+    def get_tree(self, pos):
+        (x, y) = pos
+        for agent in self.grid[x][y]:
+            if type(agent) is Tree:
+                return agent
+        return None
+
+    def has_firefighter(self, pos):
+        (x, y) = pos
+        return any(type(agent) is FireFighter for agent in self.grid[x][y])
+
+    def tree_fire_changed(self, tree):
+        if tree.on_fire:
+            self.number_on_fire += 1
+            self.fire_front.add(tree.pos)
+            self.schedule.tree_ignited(tree)
+        else:
+            self.number_on_fire -= 1
+            self.fire_front.remove(tree.pos)
+
+    def tree_density_changed(self, tree, old_density):
+        self.total_density += tree.density - old_density
+
+    def get_grid_stats(self):
+        '''
+        Statistics of the whole grid, gathered at once for the datacollector.
+        '''
+        return {"total_density": self.get_total_density(),
+                "number_on_fire": self.get_number_on_fire()}
+
     def get_total_density(self):
+        if self.engine != ForestFire.agents:
+            return self.schedule.get_total_density()
+
+        if self.debug:
+            scanned = self.scan_total_density()
+            assert isclose(self.total_density, scanned, rel_tol=1e-9, abs_tol=1e-6), \
+                f"running total density {self.total_density} does not match scan {scanned}"
+        return self.total_density
+
+    def scan_total_density(self):
         total_density = 0
         for (agents, _, _) in self.grid.coord_iter():
             for agent in agents:
@@ -163,6 +394,16 @@ class ForestFire(Model):
         return total_density
 
     def get_number_on_fire(self):
+        if self.engine != ForestFire.agents:
+            return self.schedule.get_number_on_fire()
+
+        if self.debug:
+            scanned = self.scan_number_on_fire()
+            assert self.number_on_fire == scanned, \
+                f"running burning count {self.number_on_fire} does not match scan {scanned}"
+        return self.number_on_fire
+
+    def scan_number_on_fire(self):
         total_burning = 0
         for (agents, _, _) in self.grid.coord_iter():
             for agent in agents:
@@ -172,3 +413,194 @@ class ForestFire(Model):
 
     def percentage_lost(self):
         return (1 - self.get_total_density() / self.initial_total_density) * 100
+
+    def get_landscape(self):
+        '''
+        Returns the density of every cell and the flat indices of the burning
+        cells.
+        '''
+        if self.engine != ForestFire.agents:
+            return (np.asarray(self.schedule.density), self.schedule.burning)
+
+        density = np.zeros((self.width, self.height))
+        for tree in self.schedule.tree_schedule.agents:
+            density[tree.pos] = tree.density
+        # in the order of the fire front, which the firefighters pick from
+        burning = np.array([np.ravel_multi_index(pos, (self.width, self.height)) for pos in self.fire_front.cells],
+                           dtype=int)
+        return (density, burning)
+
+    def forecast(self, samples=100, steps=None, seed=None):
+        '''
+        Fast prediction of the fire from now on if nobody fought it: the
+        probability that every cell burns within steps more steps and the
+        expected step in which it catches fire, see forecast.sample_spread.
+        '''
+        (density, burning) = self.get_landscape()
+        return sample_spread(density, burning, self.fire_spread_param, samples, steps, seed)
+
+    def get_firefighter_positions(self):
+        if self.engine != ForestFire.agents:
+            return self.schedule.firefighters.copy()
+        return np.array([firefighter.pos for firefighter in self.schedule.firefighter_schedule.agents],
+                        dtype=int).reshape(-1, 2)
+
+    def set_firefighter_positions(self, positions):
+        if self.engine != ForestFire.agents:
+            self.schedule.firefighters = np.array(positions, dtype=int).reshape(-1, 2)
+            return
+        for (firefighter, (x, y)) in zip(self.schedule.firefighter_schedule.agents, positions):
+            self.grid.move_agent(firefighter, (int(x), int(y)))
+
+    def get_burning_positions(self):
+        if self.engine != ForestFire.agents:
+            return np.column_stack(np.unravel_index(self.schedule.burning, (self.width, self.height)))
+        return np.array(self.fire_front.cells, dtype=int).reshape(-1, 2)
+
+    def extinguish_at_firefighters(self, acting):
+        '''
+        The firefighters set in acting try to extinguish the tree they stand on.
+        '''
+        if self.engine != ForestFire.agents:
+            self.schedule.extinguish_at_firefighters(acting)
+            return
+        for (firefighter, act) in zip(self.schedule.firefighter_schedule.agents, acting):
+            if act:
+                firefighter.extinguish_trees(firefighter.pos, radius=0)
+
+    def cut_down_at_firefighters(self, acting):
+        '''
+        The firefighters set in acting cut down the tree they stand on.
+        '''
+        if self.engine != ForestFire.agents:
+            for (x, y) in self.schedule.firefighters[acting]:
+                if self.schedule.density[x, y] > 0:
+                    self.schedule.cut_down(x, y, min(self.cut_down_amount, self.schedule.density[x, y]))
+                    self.cut_down_cost += 1
+            return
+        for (firefighter, act) in zip(self.schedule.firefighter_schedule.agents, acting):
+            tree = self.get_tree(firefighter.pos)
+            if act and tree is not None and tree.density > 0:
+                firefighter.cut_down_tree(tree, self.cut_down_amount)
+
+    def get_random_state(self):
+        '''
+        State of every random generator the model draws from.
+        '''
+        state = pack_random("random", self.random)
+        state.update(pack_random("firefighter_random", self.firefighter_random))
+        for name in ("landscape_rng", "ignition_rng", "rng", "firefighter_rng"):
+            state.update(pack_generator(name, getattr(self, name)))
+        return state
+
+    def set_random_state(self, state):
+        unpack_random("random", state, self.random)
+        unpack_random("firefighter_random", state, self.firefighter_random)
+        for name in ("landscape_rng", "ignition_rng", "rng", "firefighter_rng"):
+            unpack_generator(name, state, getattr(self, name))
+
+    def reseed(self, seed):
+        '''
+        Seeds every random stream of the model again, see init_random.
+        '''
+        self.init_random(seed)
+
+    def reset_randomizer(self, seed=None):
+        self.reseed(seed)
+
+    def snapshot(self):
+        '''
+        Returns the state of the simulation as compressed bytes: the density
+        and burning state of the landscape, its initial totals, the
+        firefighter positions, the costs, burnout time, fire edges, step and
+        the state of the random streams.
+        '''
+        (density, burning) = self.get_landscape()
+        state = {"density": density,
+                 "burning": burning,
+                 "firefighters": self.get_firefighter_positions(),
+                 "totals": np.array([self.initial_total_density, self.total_trees]),
+                 "costs": np.array([self.extinguish_cost, self.burn_cost, self.cut_down_cost]),
+                 "burnout_time": np.array(self.burnout_time),
+                 "fire_edges": np.array(self.fire_edges if self.fire_edges is not None else [], dtype=int),
+                 "steps": np.array(self.schedule.steps),
+                 "running": np.array(self.running)}
+        state.update(self.get_random_state())
+        return pack(state)
+
+    def restore(self, data):
+        '''
+        Continues from a snapshot of a model on a grid of the same size with
+        the same number of firefighters.
+        '''
+        state = unpack(data)
+        if state["density"].shape != (self.width, self.height):
+            raise ValueError(f"snapshot of a {state['density'].shape} grid, "
+                             f"the model has a {(self.width, self.height)} grid")
+        if len(state["firefighters"]) != self.number_firefighters:
+            raise ValueError(f"snapshot has {len(state['firefighters'])} firefighters, "
+                             f"the model has {self.number_firefighters}")
+
+        if self.engine != ForestFire.agents:
+            self.schedule.restore(state["density"], state["burning"], state["firefighters"])
+        else:
+            self.restore_agents(state["density"], state["burning"], state["firefighters"])
+
+        (self.initial_total_density, self.total_trees) = state["totals"].tolist()
+        self.total_trees = int(self.total_trees)
+        (self.extinguish_cost, self.burn_cost, self.cut_down_cost) = state["costs"].tolist()
+        self.burnout_time = int(state["burnout_time"])
+        self.fire_edges = tuple(state["fire_edges"].tolist()) or None
+        # the fireline index assumes densities only decrease, which a restore
+        # need not keep to
+        self.fireline = None
+        self.fireline_targets = None
+        self.schedule.steps = int(state["steps"])
+        self.running = bool(state["running"])
+        self.set_random_state(state)
+
+    def restore_agents(self, density, burning, firefighters):
+        for tree in self.schedule.tree_schedule.agents:
+            tree.on_fire = False
+            tree.density = float(density[tree.pos])
+
+        for cell in burning:
+            self.get_tree(np.unravel_index(cell, (self.width, self.height))).on_fire = True
+
+        self.set_firefighter_positions(firefighters)
+
+    def fork(self, n, seed=None, **parameters):
+        '''
+        Returns n new models that continue from the current state of this
+        one, each with its random streams seeded differently so they
+        branch into different continuations. Arguments of the new models can
+        be changed, e.g. to try other firefighter strategies from the same
+        state.
+        '''
+        data = self.snapshot()
+
+        branches = []
+        for branch_seed in np.random.SeedSequence(seed).generate_state(n):
+            # branches of the tiled engine get landscape files of their own
+            branch = ForestFire(**{**self.parameters, "landscape_path": None, **parameters})
+            branch.restore(data)
+            branch.reseed(int(branch_seed))
+            branches.append(branch)
+        return branches
+
+    def close(self):
+        '''
+        Releases what the engine holds outside the model, the worker
+        processes of the striped engine and the temporary landscape files of
+        the tiled engine. The final state of the striped engine can still be
+        read.
+        '''
+        close = getattr(self.schedule, "close", None)
+        if close is not None:
+            close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+
+class ArrayDataCollector:
+    """
+    Drop-in replacement for the mesa DataCollector of a model that records
+    into preallocated NumPy arrays, one per reporter. Reporters are called as
+    reporter(model, stats), where stats is computed once per collection by
+    get_stats(model), so statistics of the whole grid are only gathered once
+    no matter how many reporters use them. Only every collect_every-th step
+    is recorded, plus the last step once the model stops running.
+    """
+
+    def __init__(self, model_reporters, get_stats, collect_every=1, capacity=64):
+        self.model_reporters = model_reporters
+        self.get_stats = get_stats
+        self.collect_every = collect_every
+
+        self.size = 0
+        self.steps = np.zeros(capacity, dtype=int)
+        self.columns = {name: np.zeros(capacity) for name in model_reporters}
+
+    def collect(self, model):
+        step = model.schedule.steps
+        if step % self.collect_every != 0 and model.running:
+            return
+
+        if self.size == len(self.steps):
+            self.grow()
+
+        stats = self.get_stats(model)
+        self.steps[self.size] = step
+        for name, reporter in self.model_reporters.items():
+            self.columns[name][self.size] = reporter(model, stats)
+        self.size += 1
+
+    def grow(self):
+        capacity = 2 * len(self.steps)
+        self.steps = np.resize(self.steps, capacity)
+        for name in self.columns:
+            self.columns[name] = np.resize(self.columns[name], capacity)
+
+    @property
+    def model_vars(self):
+        """
+        The recorded values per reporter, like DataCollector.model_vars.
+        """
+        return {name: column[:self.size] for name, column in self.columns.items()}
+
+    def get_model_vars_dataframe(self):
+        """
+        Returns the recorded values as a DataFrame indexed by step, like
+        DataCollector.get_model_vars_dataframe().
+        """
+        return pd.DataFrame(self.model_vars, index=self.steps[:self.size].copy())
@@ -1,11 +1,30 @@
 from mesa.time import RandomActivation
+from heapq import heapify, heappop, heappush
+
+
+class FirefighterActivation(RandomActivation):
+    """
+    RandomActivation that shuffles with the firefighter random stream of the
+    model, so the order of the firefighters does not take numbers from the
+    stream of the fire.
+    """
+
+    def agent_buffer(self, shuffled=False):
+        agent_keys = list(self._agents.keys())
+        if shuffled:
+            self.model.firefighter_random.shuffle(agent_keys)
+
+        for key in agent_keys:
+            if key in self._agents:
+                yield self._agents[key]
+
 
 class RandomActivationForestFire(RandomActivation):
     
     def __init__(self, model):
         super().__init__(model)
         self.tree_schedule = RandomActivation(model)
-        self.firefighter_schedule = RandomActivation(model)
+        self.firefighter_schedule = FirefighterActivation(model)
 
         self.steps = 0
 
@@ -20,4 +39,46 @@ class RandomActivationForestFire(RandomActivation):
         self.tree_schedule.add(tree)
 
     def add_firefighter(self, firefighter):
-        self.firefighter_schedule.add(firefighter)
\ No newline at end of file
+        self.firefighter_schedule.add(firefighter)
+
+    def tree_ignited(self, tree):
+        pass
+
+
+class RandomActivationFireFront(RandomActivationForestFire):
+    """
+    Only activates the trees that are on fire, as the others do nothing when
+    they step. Every burning tree gets a random activation time within the
+    step. A tree that catches fire during the step draws a time as well, and
+    is still activated in this step if that time has not passed yet. This
+    gives the same outcomes as activating all trees in random order.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+
+        # activation queue of the current step, None in between steps
+        self.queue = None
+        self.time = 0
+
+    def step(self, activate_firefighters=True):
+        self.time = 0
+        self.queue = [(self.model.random.random(), tree.unique_id, tree)
+                      for tree in map(self.model.get_tree, list(self.model.fire_front.cells))]
+        heapify(self.queue)
+
+        while self.queue:
+            (self.time, _, tree) = heappop(self.queue)
+            tree.step()
+        self.queue = None
+
+        if activate_firefighters:
+            self.firefighter_schedule.step()
+
+        self.steps += 1
+
+    def tree_ignited(self, tree):
+        if self.queue is not None:
+            time = self.model.random.random()
+            if time > self.time:
+                heappush(self.queue, (time, tree.unique_id, tree))
@@ -0,0 +1,252 @@
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from sweep import make_pool
+
+# every bootstrap task draws this many resamples, so the confidence
+# intervals do not depend on the number of processes
+resamples_per_task = 10
+
+
+def sobol_indices(A, B, AB, BA, mean):
+    """
+    First, total and second order Sobol indices with the estimators of
+    SALib's sobol.analyze, for one or many resamples at once. A and B have
+    one row per base sample and one column per resample, AB and BA an extra
+    last axis over the parameters, and the outputs are centred on mean.
+    Returns S1 and ST with shape (resamples, D) and S2 with shape
+    (resamples, D, D), with undefined indices zero like SALib.
+    """
+    variance = np.var(np.concatenate([A, B]), axis=0)[:, None]
+    defined = variance > np.finfo(float).eps
+    variance = np.where(defined, variance, 1)
+
+    S1 = np.mean((B - mean)[..., None] * (AB - A[..., None]), axis=0) / variance * defined
+    ST = 0.5 * np.mean((A[..., None] - AB) ** 2, axis=0) / variance * defined
+    if BA is None:
+        return S1, ST, None
+
+    V = (np.einsum('nrj,nrk->rjk', BA - mean, AB - mean) / len(A) -
+         np.mean((A - mean) * (B - mean), axis=0)[:, None, None])
+    S2 = V / variance[..., None] * defined[..., None] - S1[:, :, None] - S1[:, None, :]
+    return S1, ST, S2
+
+
+# blocks of the analysis, set by init_worker in the bootstrap processes
+worker = {}
+
+
+def init_worker(state):
+    worker.update(state)
+
+
+def bootstrap_task(task):
+    """
+    Indices of a number of resamples of the base samples, drawn with
+    replacement.
+    """
+    (seed, number) = task
+    rng = np.random.default_rng(seed)
+    r = rng.integers(len(worker['A']), size=(len(worker['A']), number))
+    BA = worker['BA'][r] if worker['BA'] is not None else None
+    return sobol_indices(worker['A'][r], worker['B'][r], worker['AB'][r], BA, worker['mean'])
+
+
+class IncrementalSobol:
+    """
+    Sobol indices of one output of a Saltelli sweep, updated as its runs
+    arrive instead of once the sweep is done. The runs of a sweep make up
+    blocks of 2D + 2 samples (D + 2 without second order indices) per base
+    sample and replicate, and every replicate adds its blocks as extra base
+    samples, like passing all runs of the sweep to sobol.analyze. Runs may
+    arrive in any order; a block counts once all its runs are in.
+
+    Complete blocks are added to running sums, from which the indices are
+    computed in time independent of the number of runs, so they can be
+    watched after every chunk of a running sweep, see stable. Confidence
+    intervals take a bootstrap over the blocks, which is spread over a pool
+    of processes.
+    """
+
+    def __init__(self, problem, output='Percentage lost', calc_second_order=True):
+        self.problem = problem
+        self.output = output
+        self.calc_second_order = calc_second_order
+        self.D = problem['num_vars']
+        self.step = 2 * self.D + 2 if calc_second_order else self.D + 2
+
+        # incomplete blocks by (replicate, base sample)
+        self.pending = {}
+        self.blocks = []
+        self.files = set()
+        # indices after every update, for stable
+        self.history = []
+
+        self.shift = None
+        self.sums = None
+
+    def add(self, records):
+        """
+        Adds the results of runs, dicts with the 'sample' and 'replicate' of
+        the run and the output, like the records of run_sweep. Returns False,
+        so it can be the callback of run_sweep as is.
+        """
+        added = 0
+        for record in records:
+            (base, position) = divmod(int(record['sample']), self.step)
+            key = (int(record['replicate']), base)
+            block = self.pending.setdefault(key, np.full(self.step, np.nan))
+            block[position] = record[self.output]
+            if not np.isnan(block).any():
+                del self.pending[key]
+                self.add_block(block)
+                added += 1
+
+        if added:
+            self.history.append((len(self.blocks),) + self.indices()[:2])
+        return False
+
+    def add_values(self, values):
+        """
+        Adds the outputs of runs in run order, as they are passed to
+        sobol.analyze.
+        """
+        values = np.asarray(values, dtype=float).reshape(-1, self.step)
+        for block in values:
+            self.add_block(block)
+        if len(values):
+            self.history.append((len(self.blocks),) + self.indices()[:2])
+
+    def update_from_store(self, store):
+        """
+        Adds the runs of the chunks of a result store that were not read
+        before, so it can follow a sweep that writes to the store.
+        """
+        files = [path for path in store.chunk_files() if path not in self.files]
+        for chunk in store.iter_chunks(['sample', 'replicate', self.output], files):
+            self.add(chunk.to_dict('records'))
+        self.files.update(files)
+
+    def add_block(self, block):
+        self.blocks.append(block)
+        if self.shift is None:
+            # outputs are summed relative to the first block, against
+            # cancellation in the sums of squares
+            self.shift = block.mean()
+
+        block = block - self.shift
+        (a, b, ab) = (block[0], block[-1], block[1:self.D + 1])
+        ba = block[self.D + 1:2 * self.D + 1] if self.calc_second_order else np.zeros(self.D)
+        terms = {'n': 1, 'all': block.sum(), 'a': a, 'b': b, 'aa': a * a, 'bb': b * b, 'ab': a * b,
+                 'AB': ab, 'BA': ba, 'b.AB': b * ab, 'a.AB': a * ab, 'AB.AB': ab * ab,
+                 'BA.AB': np.outer(ba, ab)}
+        if self.sums is None:
+            self.sums = {name: np.zeros_like(term, dtype=float) for (name, term) in terms.items()}
+        for (name, term) in terms.items():
+            self.sums[name] += term
+
+    def indices(self):
+        """
+        Returns the first, total and second order indices of the blocks so
+        far, the latter with NaN outside the upper triangle like SALib.
+        """
+        D = self.D
+        (S1, ST, S2) = (np.full(D, np.nan), np.full(D, np.nan), np.full((D, D), np.nan))
+        if self.sums is None:
+            return S1, ST, S2
+
+        s = self.sums
+        n = s['n']
+        mean = s['all'] / (n * self.step)
+        variance = (s['aa'] + s['bb']) / (2 * n) - ((s['a'] + s['b']) / (2 * n)) ** 2
+        if variance <= np.finfo(float).eps:
+            return np.zeros(D), np.zeros(D), np.where(np.triu(np.ones((D, D)), 1) > 0, 0, np.nan)
+
+        S1 = (s['b.AB'] - s['ab'] - mean * (s['AB'] - s['a'])) / (n * variance)
+        ST = 0.5 * (s['aa'] - 2 * s['a.AB'] + s['AB.AB']) / (n * variance)
+        if self.calc_second_order:
+            V = (s['BA.AB'] - s['ab'] - mean * (s['BA'][:, None] + s['AB'][None, :] - s['a'] - s['b']))
+            upper = np.triu(np.ones((D, D)), 1) > 0
+            S2[upper] = (V / (n * variance) - S1[:, None] - S1[None, :])[upper]
+        return S1, ST, S2
+
+    def stable(self, tolerance=0.01, blocks=None):
+        """
+        Whether the first and total order indices moved less than tolerance
+        over the last blocks blocks, by default the last fifth of them.
+        """
+        if not self.history:
+            return False
+
+        (n, S1, ST) = self.history[-1]
+        blocks = blocks if blocks is not None else max(1, n // 5)
+        earlier = [entry for entry in self.history if entry[0] <= n - blocks]
+        if not earlier:
+            return False
+
+        (_, S1_before, ST_before) = earlier[-1]
+        return max(np.abs(S1 - S1_before).max(), np.abs(ST - ST_before).max()) < tolerance
+
+    def analyze(self, num_resamples=100, conf_level=0.95, processes=None, seed=None, print_to_console=False):
+        """
+        Returns the indices in the layout of sobol.analyze: a dict with
+        'S1', 'ST' and 'S2' and their confidence intervals 'S1_conf',
+        'ST_conf' and 'S2_conf' from a bootstrap over the blocks, which is
+        spread over a pool of processes. Results can be plotted with
+        datavis.plot_index.
+        """
+        (S1, ST, S2) = self.indices()
+        blocks = np.array(self.blocks).reshape(-1, self.step)
+        state = {'A': blocks[:, 0],
+                 'B': blocks[:, -1],
+                 'AB': blocks[:, 1:self.D + 1],
+                 'BA': blocks[:, self.D + 1:2 * self.D + 1] if self.calc_second_order else None,
+                 'mean': blocks.mean() if len(blocks) else 0}
+
+        tasks = []
+        seeds = np.random.SeedSequence(seed).spawn(-(-num_resamples // resamples_per_task))
+        for (i, child) in enumerate(seeds):
+            tasks.append((child, min(resamples_per_task, num_resamples - i * resamples_per_task)))
+
+        processes = min(processes or multiprocessing.cpu_count(), len(tasks)) or 1
+        if len(blocks):
+            with make_pool(state, processes, init_worker) as pool:
+                results = list(pool.imap(bootstrap_task, tasks))
+        else:
+            results = []
+
+        Z = norm.ppf(0.5 + conf_level / 2)
+
+        def conf(index, estimates):
+            if not estimates:
+                return np.full(np.shape(index), np.nan)
+            return Z * np.concatenate(estimates).std(axis=0, ddof=1)
+
+        S = {'S1': S1, 'S1_conf': conf(S1, [result[0] for result in results]),
+             'ST': ST, 'ST_conf': conf(ST, [result[1] for result in results])}
+        if self.calc_second_order:
+            upper = np.triu(np.ones((self.D, self.D)), 1) > 0
+            S['S2'] = S2
+            S['S2_conf'] = np.where(upper, conf(S2, [result[2] for result in results]), np.nan)
+
+        if print_to_console:
+            for frame in self.to_frames(S):
+                print(frame)
+        return S
+
+    def to_frames(self, S):
+        """
+        The indices of analyze as DataFrames, like SALib prints them.
+        """
+        names = self.problem['names']
+        frames = [pd.DataFrame({'ST': S['ST'], 'ST_conf': S['ST_conf']}, index=names),
+                  pd.DataFrame({'S1': S['S1'], 'S1_conf': S['S1_conf']}, index=names)]
+        if 'S2' in S:
+            pairs = [(j, k) for j in range(self.D) for k in range(j + 1, self.D)]
+            frames.append(pd.DataFrame({'S2': [S['S2'][j, k] for (j, k) in pairs],
+                                        'S2_conf': [S['S2_conf'][j, k] for (j, k) in pairs]},
+                                       index=[(names[j], names[k]) for (j, k) in pairs]))
+        return frames
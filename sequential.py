@@ -0,0 +1,163 @@
+import numpy as np
+
+from agents import FireFighter
+from engine import ArrayForest
+from fireline import fireline_coords
+from terrain import DIRT
+
+try:
+    from numba import njit
+    compiled = True
+except ImportError:
+    compiled = False
+
+    def njit(*args, **kwargs):
+        """
+        Without Numba the kernels run as plain Python.
+        """
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+
+@njit(cache=True)
+def spread_sequential(density, on_fire, trees, height, fire_spread_param, rng):
+    """
+    Tree.step for every tree in a random order, like RandomActivation, on the
+    flat density and on_fire arrays. trees holds the flat indices of the
+    trees. Random numbers are drawn from the NumPy Generator rng, which
+    compiled kernels draw from just the same.
+    """
+    width = len(density) // height
+    for cell in rng.permutation(trees):
+        if not on_fire[cell]:
+            continue
+
+        x = cell // height
+        y = cell % height
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if (dx == 0 and dy == 0) or not (0 <= x + dx < width and 0 <= y + dy < height):
+                    continue
+                neighbour = (x + dx) * height + y + dy
+                if not on_fire[neighbour] and density[neighbour] > 0:
+                    if rng.random() < density[neighbour] * fire_spread_param:
+                        on_fire[neighbour] = True
+
+        # burn down
+        density[cell] = 0
+        on_fire[cell] = False
+
+
+@njit(cache=True)
+def extinguish_sequential(density, on_fire, burning, firefighters, nearest, height, extinguish_difficulty,
+                          max_density, rng):
+    """
+    FireFighter.extinguish_only, or extinguish_nearest if nearest is set, for
+    every firefighter in a random order. firefighters holds their flat cells
+    and is updated in place. Returns the number of trees extinguished.
+    """
+    width = len(on_fire) // height
+    occupied = np.zeros(len(on_fire), dtype=np.int64)
+    for cell in firefighters:
+        occupied[cell] += 1
+
+    free = np.empty(len(burning), dtype=np.int64)
+    extinguished = 0
+    for i in rng.permutation(len(firefighters)):
+        # burning cells without a firefighter
+        number = 0
+        for cell in burning:
+            if on_fire[cell] and occupied[cell] == 0:
+                free[number] = cell
+                number += 1
+
+        if number:
+            if nearest:
+                (x, y) = (firefighters[i] // height, firefighters[i] % height)
+                # closest in Chebyshev distance, then in Euclidean distance
+                (best, target) = (-1, free[0])
+                for j in range(number):
+                    (dx, dy) = (abs(free[j] // height - x), abs(free[j] % height - y))
+                    distance = max(dx, dy) * (width ** 2 + height ** 2 + 1) + dx ** 2 + dy ** 2
+                    if best < 0 or distance < best:
+                        (best, target) = (distance, free[j])
+            else:
+                target = free[rng.integers(0, number)]
+            occupied[firefighters[i]] -= 1
+            occupied[target] += 1
+            firefighters[i] = target
+
+        cell = firefighters[i]
+        if on_fire[cell] and rng.beta(1.0, extinguish_difficulty) * max_density > density[cell]:
+            on_fire[cell] = False
+            extinguished += 1
+
+    return extinguished
+
+
+@njit(cache=True)
+def firelines_sequential(density, fireline, firefighters, cut_down_amount, rng):
+    """
+    FireFighter.firelines_only for every firefighter in a random order,
+    where fireline holds the flat cells of the fireline. Returns the number
+    of trees cut.
+    """
+    cut = 0
+    for i in rng.permutation(len(firefighters)):
+        best = -1
+        for cell in fireline:
+            if density[cell] > 0 and (best < 0 or density[cell] > density[best]):
+                best = cell
+
+        if best < 0:
+            firefighters[i] = 0
+        else:
+            firefighters[i] = best
+            density[best] -= min(cut_down_amount, density[best])
+            cut += 1
+
+    return cut
+
+
+class SequentialForest(ArrayForest):
+    """
+    ArrayForest with the exact semantics of the agent model: every step the
+    trees are stepped one at a time in a random order, so a tree that caught
+    fire earlier in the step spreads it in the same step, and then the
+    firefighters act one at a time in a random order. The loops run as
+    Numba-compiled kernels if Numba is installed, and as plain Python
+    otherwise.
+    """
+
+    def init_forest(self):
+        super().init_forest()
+        self.trees = np.flatnonzero(self.model.terrain == DIRT)
+
+    def step(self, activate_firefighters=True):
+        model = self.model
+        density = self.density.reshape(-1)
+        on_fire = self.on_fire.reshape(-1)
+
+        spread_sequential(density, on_fire, self.trees, model.height, model.fire_spread_param, model.rng)
+        self.burning = np.flatnonzero(on_fire)
+
+        if activate_firefighters and model.firefighter_strategy == FireFighter.firelines_batch:
+            # picking distinct targets at once has no order to keep
+            self.firelines()
+        elif activate_firefighters and len(self.burning) and len(self.firefighters):
+            firefighters = self.firefighter_cells()
+            if model.firefighter_strategy in (FireFighter.extinguish, FireFighter.nearest):
+                model.extinguish_cost += extinguish_sequential(
+                    density, on_fire, self.burning, firefighters, model.firefighter_strategy == FireFighter.nearest,
+                    model.height, model.extinguish_difficulty, model.max_density, model.firefighter_rng)
+                self.burning = self.burning[on_fire[self.burning]]
+            elif model.firefighter_strategy == FireFighter.firelines:
+                coords = [fireline_coords(edges, model.fire_line_margin, model.width, model.height)
+                          for edges in model.get_fire_boxes()]
+                fireline = np.concatenate([xs * model.height + ys for (xs, ys) in coords])
+                model.cut_down_cost += firelines_sequential(density, fireline, firefighters,
+                                                            model.cut_down_amount, model.firefighter_rng)
+            self.firefighters = np.column_stack(np.unravel_index(firefighters, self.on_fire.shape))
+
+        self.steps += 1
@@ -0,0 +1,50 @@
+import io
+import json
+
+import numpy as np
+
+
+def pack(arrays):
+    """
+    Serialises a dict of arrays to compressed .npz bytes.
+    """
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def unpack(data):
+    """
+    Reads the dict of arrays back from bytes written by pack.
+    """
+    with np.load(io.BytesIO(data)) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+def pack_random(name, generator):
+    """
+    State of a random.Random as arrays, prefixed with name.
+    """
+    (version, state, gauss_next) = generator.getstate()
+    return {name + "_version": np.array(version),
+            name + "_state": np.array(state, dtype=np.uint64),
+            name + "_gauss": np.array(np.nan if gauss_next is None else gauss_next)}
+
+
+def unpack_random(name, arrays, generator):
+    gauss_next = float(arrays[name + "_gauss"])
+    generator.setstate((int(arrays[name + "_version"]),
+                        tuple(int(value) for value in arrays[name + "_state"]),
+                        None if np.isnan(gauss_next) else gauss_next))
+
+
+def pack_generator(name, generator):
+    """
+    State of a NumPy Generator as arrays, prefixed with name. The state holds
+    integers too large for arrays, so it is stored as JSON.
+    """
+    return {name + "_generator": np.array(json.dumps(generator.bit_generator.state))}
+
+
+def unpack_generator(name, arrays, generator):
+    generator.bit_generator.state = json.loads(str(arrays[name + "_generator"]))
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class ResultStore:
+    """
+    Append-only store for sweep results in a directory. Every append writes a
+    new chunk file holding one array per column, keyed by the sample index and
+    replicate of each run. Chunks are written to a temporary file first and
+    then renamed, so a crash never leaves a partial chunk behind, and a
+    restarted sweep can skip the runs that are already stored.
+    """
+
+    key_columns = ['sample', 'replicate']
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def chunk_files(self):
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path)
+                      if name.startswith('chunk-') and name.endswith('.npz'))
+
+    def append(self, records):
+        """
+        Writes a list of result dicts, each with at least 'sample' and
+        'replicate', as a new chunk.
+        """
+        if not records:
+            return
+
+        columns = {name: np.array([record[name] for record in records]) for name in records[0]}
+
+        files = self.chunk_files()
+        number = int(os.path.basename(files[-1])[6:-4]) + 1 if files else 0
+        path = os.path.join(self.path, f'chunk-{number:06d}.npz')
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(temporary, path)
+
+    def keys(self):
+        """
+        Returns the set of (sample, replicate) pairs that are stored.
+        """
+        keys = set()
+        for path in self.chunk_files():
+            with np.load(path) as chunk:
+                keys.update(zip(chunk['sample'].tolist(), chunk['replicate'].tolist()))
+        return keys
+
+    def iter_chunks(self, columns=None, files=None):
+        """
+        Yields every chunk, or the given chunk files, as a DataFrame, loading
+        only the given columns.
+        """
+        for path in files if files is not None else self.chunk_files():
+            with np.load(path) as chunk:
+                names = columns if columns is not None else chunk.files
+                yield pd.DataFrame({name: chunk[name] for name in names})
+
+    def to_dataframe(self, columns=None, order_by='Run'):
+        """
+        Returns the stored results as one DataFrame, ordered by run.
+        """
+        if columns is not None and order_by not in columns:
+            columns = list(columns) + [order_by]
+
+        chunks = list(self.iter_chunks(columns))
+        if not chunks:
+            return pd.DataFrame(columns=columns)
+
+        data = pd.concat(chunks, ignore_index=True)
+        return data.sort_values(by=order_by).reset_index(drop=True)
+
+    def column(self, name, order_by='Run'):
+        """
+        Returns a single column as an array, ordered by run.
+        """
+        return self.to_dataframe([name], order_by)[name].to_numpy()
@@ -0,0 +1,229 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+from numpy.polynomial import legendre
+from scipy.stats import norm
+
+from sweep import run_seed, run_sweep
+
+
+def multi_indices(dimensions, degree):
+    """
+    Exponents of all products of polynomials in the given number of
+    dimensions with a total degree of at most degree, lowest degree first.
+    """
+    indices = [index for index in itertools.product(range(degree + 1), repeat=dimensions) if sum(index) <= degree]
+    return np.array(sorted(indices, key=sum))
+
+
+class PolynomialChaos:
+    """
+    Polynomial chaos emulator of model outputs over the parameters of a
+    SALib problem, trained on sweep results. Parameters are scaled from
+    their bounds to [-1, 1], and every output is a sum of products of
+    Legendre polynomials up to a total degree, which are orthonormal for
+    parameters drawn uniformly from their bounds, like the Saltelli samples.
+
+    The coefficients are fitted by Bayesian least squares with a small
+    ridge prior, so predictions come with the standard deviation of the
+    emulated mean and, with noise, of a single run. As the polynomials are
+    orthonormal, the variance of an output splits into the squares of the
+    coefficients, which gives Sobol indices analytically.
+    """
+
+    def __init__(self, problem, degree=3, ridge=1e-6):
+        self.problem = problem
+        self.degree = degree
+        self.ridge = ridge
+        self.indices = multi_indices(problem['num_vars'], degree)
+        self.bounds = np.array(problem['bounds'], dtype=float)
+
+        self.outputs = None
+        self.coefficients = None
+        self.noise = None
+        self.covariance = None
+
+    def scale(self, X):
+        """
+        Parameters of the points X, an array or a DataFrame with a column
+        per parameter, scaled to [-1, 1].
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X[self.problem['names']].to_numpy()
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        (low, high) = self.bounds.T
+        return 2 * (X - low) / (high - low) - 1
+
+    def basis(self, X):
+        """
+        Values of all polynomials at the points X, one row per point.
+        """
+        x = self.scale(X)
+        # orthonormal Legendre polynomials of every parameter
+        values = legendre.legvander(x, self.degree) * np.sqrt(2 * np.arange(self.degree + 1) + 1)
+        columns = np.ones((len(x), len(self.indices)))
+        for (i, exponents) in enumerate(self.indices.T):
+            columns *= values[:, i, exponents]
+        return columns
+
+    def fit(self, X, Y):
+        """
+        Fits the emulator to the outputs Y of runs with parameters X, with
+        one column per output. Replicates of a point are separate rows.
+        """
+        if isinstance(Y, pd.Series):
+            Y = Y.to_frame()
+        names = list(Y.columns) if isinstance(Y, pd.DataFrame) else None
+        Y = np.asarray(Y, dtype=float).reshape(len(Y), -1)
+        self.outputs = names if names is not None else list(range(Y.shape[1]))
+
+        Phi = self.basis(X)
+        self.covariance = np.linalg.inv(Phi.T @ Phi + self.ridge * len(Phi) * np.eye(len(self.indices)))
+        self.coefficients = self.covariance @ Phi.T @ Y
+
+        residuals = Y - Phi @ self.coefficients
+        self.noise = (residuals ** 2).sum(axis=0) / max(len(Phi) - len(self.indices), 1)
+        return self
+
+    def variance_factor(self, X):
+        """
+        Variance of the emulated mean at every point of X, relative to the
+        noise variance of the outputs.
+        """
+        Phi = self.basis(X)
+        return np.einsum('ij,jk,ik->i', Phi, self.covariance, Phi)
+
+    def predict(self, X, noise=False):
+        """
+        Returns the emulated mean of every output at the points X and its
+        standard deviation, each with one row per point and one column per
+        output. With noise, the standard deviation is that of a single run
+        rather than of the mean.
+        """
+        mean = self.basis(X) @ self.coefficients
+        variance = self.variance_factor(X)[:, None] * self.noise
+        if noise:
+            variance = variance + self.noise
+        return mean, np.sqrt(variance)
+
+    def predict_frame(self, X, noise=False):
+        """
+        Predictions as a DataFrame with the mean and std of every output.
+        """
+        (mean, std) = self.predict(X, noise)
+        frame = {}
+        for (i, output) in enumerate(self.outputs):
+            frame[output] = mean[:, i]
+            frame[f'{output} std'] = std[:, i]
+        return pd.DataFrame(frame)
+
+    def sobol(self, output=0, conf_level=0.95, samples=1000, seed=None):
+        """
+        Sobol indices of an output, by name or position, from the
+        coefficients, in the layout of sobol.analyze so datavis.plot_index
+        plots them. The confidence intervals come from drawing the
+        coefficients from their posterior.
+        """
+        k = self.outputs.index(output) if output in self.outputs else output
+        D = self.problem['num_vars']
+        active = self.indices > 0
+        order = active.sum(axis=1)
+
+        first = active & (order == 1)[:, None]
+        second = np.zeros((len(self.indices), D, D), dtype=bool)
+        for (j, l) in itertools.combinations(range(D), 2):
+            second[:, j, l] = active[:, j] & active[:, l] & (order == 2)
+
+        def indices(squares):
+            variance = squares[:, order > 0].sum(axis=1)[:, None]
+            variance = np.where(variance > 0, variance, np.inf)
+            S1 = squares @ first / variance
+            ST = squares @ active / variance
+            S2 = np.einsum('sp,pjl->sjl', squares, second) / variance[..., None]
+            return S1, ST, S2
+
+        rng = np.random.default_rng(seed)
+        draws = rng.multivariate_normal(self.coefficients[:, k], self.covariance * self.noise[k], samples,
+                                        method='cholesky')
+        (S1, ST, S2) = (index[0] for index in indices(self.coefficients[None, :, k] ** 2))
+        (S1_draws, ST_draws, S2_draws) = indices(draws ** 2)
+
+        Z = norm.ppf(0.5 + conf_level / 2)
+        upper = np.triu(np.ones((D, D), dtype=bool), 1)
+        return {'S1': S1, 'S1_conf': Z * S1_draws.std(axis=0, ddof=1),
+                'ST': ST, 'ST_conf': Z * ST_draws.std(axis=0, ddof=1),
+                'S2': np.where(upper, S2, np.nan),
+                'S2_conf': np.where(upper, Z * S2_draws.std(axis=0, ddof=1), np.nan)}
+
+
+def uniform_points(problem, number, rng):
+    (low, high) = np.array(problem['bounds'], dtype=float).T
+    return low + (high - low) * rng.random((number, problem['num_vars']))
+
+
+def select_batch(surrogate, candidates, number):
+    """
+    Greedily picks the number candidates where the emulated mean is most
+    uncertain. The posterior of the coefficients only depends on where the
+    runs are, not on their outputs, so after every pick the uncertainty is
+    updated as if it had been run, and a batch spreads out over the
+    uncertain regions instead of piling up at the most uncertain point.
+    """
+    Phi = surrogate.basis(candidates)
+    covariance = surrogate.covariance.copy()
+    chosen = []
+    for _ in range(min(number, len(candidates))):
+        factor = np.einsum('ij,jk,ik->i', Phi, covariance, Phi)
+        factor[chosen] = -np.inf
+        best = int(np.argmax(factor))
+        chosen.append(best)
+        projected = covariance @ Phi[best]
+        covariance -= np.outer(projected, projected) / (1 + factor[best])
+    return candidates[chosen]
+
+
+def active_learning(model_cls, problem, model_reporters, degree=3, initial=50, batch=20, max_runs=500,
+                    replicates=1, target_std=None, candidates=2000, max_steps=50, integer_params=(),
+                    fixed_parameters=None, seed=0, processes=None, progress=True):
+    """
+    Trains a PolynomialChaos emulator of the reporters of a model, choosing
+    the runs to do as it goes: it starts with initial random points and
+    then, every round, runs the batch of random candidate points where the
+    emulated mean is most uncertain, see select_batch, and refits. It stops
+    after max_runs runs, or once the standard deviation of the emulated
+    mean of every output is below target_std (a dict by output) at all
+    candidates. Runs go through run_sweep.
+
+    Returns the emulator and a DataFrame of all runs, with the round they
+    were run in.
+    """
+    rng = np.random.default_rng(seed)
+    outputs = sorted(model_reporters)
+    surrogate = PolynomialChaos(problem, degree)
+
+    data = []
+    points = uniform_points(problem, initial, rng)
+    round_ = 0
+    while len(points):
+        runs = run_sweep(model_cls, problem, points, replicates, model_reporters, max_steps=max_steps,
+                         integer_params=integer_params, fixed_parameters=fixed_parameters,
+                         seed=run_seed(seed, round_), processes=processes, progress=progress)
+        data.append(runs.assign(Round=round_))
+        round_ += 1
+
+        frame = pd.concat(data, ignore_index=True)
+        surrogate.fit(frame[problem['names']], frame[outputs])
+
+        remaining = (max_runs - len(frame)) // replicates
+        if remaining <= 0:
+            break
+
+        pool = uniform_points(problem, candidates, rng)
+        if target_std is not None:
+            (_, std) = surrogate.predict(pool)
+            if all(std[:, outputs.index(output)].max() <= width for (output, width) in target_std.items()):
+                break
+        points = select_batch(surrogate, pool, min(batch, remaining))
+
+    return surrogate, pd.concat(data, ignore_index=True)
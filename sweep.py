@@ -0,0 +1,251 @@
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+class Progress:
+    """
+    Reports the progress of a sweep on a single, regularly updated line
+    instead of printing every run.
+    """
+
+    def __init__(self, total, interval=1, stream=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.stream = stream
+
+        self.done = 0
+        self.start = time.time()
+        self.last_report = 0
+
+    def update(self, done=1):
+        self.done += done
+        now = time.time()
+        if now - self.last_report >= self.interval or self.done == self.total:
+            self.last_report = now
+            self.report(now - self.start)
+
+    def report(self, elapsed):
+        remaining = elapsed / self.done * (self.total - self.done) if self.done else 0
+        self.stream.write(f"\r{self.done}/{self.total} runs ({self.done / self.total * 100:.2f}%), "
+                          f"{elapsed:.0f}s elapsed, {remaining:.0f}s remaining ")
+        if self.done == self.total:
+            self.stream.write("\n")
+        self.stream.flush()
+
+
+def run_seed(seed, run):
+    """
+    Deterministic seed of a run, independent of how runs are spread over processes.
+    """
+    return int(np.random.SeedSequence([seed, run]).generate_state(1)[0])
+
+
+def sample_parameters(problem, param_values, integer_params, run):
+    """
+    Parameters of a run, where runs go through all samples once per replicate
+    like the loops in sa.py.
+    """
+    vals = param_values[run % len(param_values)]
+    parameters = {}
+    for name, val in zip(problem['names'], vals):
+        parameters[name] = int(val) if name in integer_params else float(val)
+    return parameters
+
+
+def run_model(model_cls, parameters, max_steps, model_reporters, seed, cache=None):
+    """
+    Runs a single model like BatchRunner.run_iteration and returns its
+    reports, from the cache if the run was done before. Unseeded runs differ
+    every time, so they are never cached.
+    """
+    if seed is None:
+        cache = None
+    if cache is not None:
+        key = cache.key(model_cls, parameters, seed, max_steps)
+        reports = cache.get(key, model_reporters)
+        if reports is not None:
+            return reports
+
+    model = model_cls(seed=seed, **parameters)
+    while model.running and model.schedule.steps < max_steps:
+        model.step()
+
+    reports = {var: reporter(model) for var, reporter in model_reporters.items()}
+    close = getattr(model, 'close', None)
+    if close is not None:
+        close()
+    if cache is not None:
+        cache.put(key, reports)
+    return reports
+
+
+# state of the worker processes, set by init_worker
+worker = {}
+
+
+def init_worker(state):
+    worker.update(state)
+
+
+def run_chunk(runs):
+    results = []
+    for run in runs:
+        parameters = sample_parameters(worker['problem'], worker['param_values'], worker['integer_params'], run)
+        parameters.update(worker['fixed_parameters'])
+        # with common random numbers all samples of a replicate share a seed
+        key = run // len(worker['param_values']) if worker['common_random_numbers'] else run
+        reports = run_model(worker['model_cls'], parameters, worker['max_steps'], worker['model_reporters'],
+                            run_seed(worker['seed'], key), worker['cache'])
+        results.append((run, reports))
+    return results
+
+
+class SerialPool:
+    """
+    Runs chunks in this process, with the interface of a Pool.
+    """
+
+    def __init__(self, state, initializer=init_worker):
+        initializer(state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def imap(self, function, chunks):
+        return map(function, chunks)
+
+    imap_unordered = imap
+
+
+def make_pool(state, processes, initializer=init_worker):
+    """
+    Returns a pool of processes that run chunks with the given worker state,
+    set by initializer, or a SerialPool with a single process.
+    """
+    if processes == 1:
+        return SerialPool(state, initializer)
+
+    # forked workers inherit the state, so reporters may be lambdas
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    return context.Pool(processes, initializer=initializer, initargs=(state,))
+
+
+def sweep_state(model_cls, problem, param_values, model_reporters, max_steps, integer_params,
+                fixed_parameters, seed, common_random_numbers, cache=None):
+    """
+    State of the worker processes of a sweep, see run_sweep.
+    """
+    return {'model_cls': model_cls,
+            'problem': problem,
+            'param_values': np.asarray(param_values),
+            'integer_params': set(integer_params),
+            'fixed_parameters': fixed_parameters or {},
+            'max_steps': max_steps,
+            'model_reporters': model_reporters,
+            'seed': seed,
+            'common_random_numbers': common_random_numbers,
+            'cache': cache}
+
+
+def run_record(state, run, reports):
+    """
+    Result of a run as a dict with its sample, replicate, parameters, run
+    number and reports.
+    """
+    samples = len(state['param_values'])
+    record = {'sample': run % samples, 'replicate': run // samples}
+    record.update(sample_parameters(state['problem'], state['param_values'], state['integer_params'], run))
+    record['Run'] = run
+    record.update(reports)
+    return record
+
+
+def run_sweep(model_cls, problem, param_values, replicates, model_reporters, max_steps=50,
+              integer_params=(), fixed_parameters=None, seed=0, processes=None, chunksize=None,
+              progress=True, store=None, flush_every=1000, common_random_numbers=False, callback=None,
+              cache=None):
+    """
+    Runs every sample of a SALib problem a number of times, spread over a
+    pool of processes, and returns a DataFrame with the layout of
+    BatchRunner.get_model_vars_dataframe(): one column per parameter, the
+    run number and one column per reporter, ordered by run. Runs go through
+    all samples once per replicate, like the loops in sa.py.
+
+    Args:
+        model_cls: the model class, e.g. ForestFire
+        problem (dict): SALib problem with the names of the parameters
+        param_values (array): sample matrix, one row per sample
+        replicates (int): number of runs per sample
+        model_reporters (dict): reporters evaluated at the end of every run
+        max_steps (int): maximum number of steps per run
+        integer_params (list): names of parameters that are cast to int
+        fixed_parameters (dict): other arguments for every model
+        seed (int): every run is seeded from this seed and its run number,
+            so results do not depend on the number of processes; the model
+            class takes the seed of a run as its seed argument
+        processes (int): size of the pool, defaults to the number of cores,
+            with 1 all runs happen in this process
+        chunksize (int): number of runs per task
+        progress (bool): report progress on stderr
+        store (ResultStore): if given, results are appended to the store as
+            they arrive instead of being kept in memory, and runs that are
+            already in the store are skipped
+        flush_every (int): number of results per chunk written to the store
+        common_random_numbers (bool): seed runs by replicate only, so every
+            sample of a replicate gets the same landscape, ignition, spread
+            and firefighter random numbers, which takes fewer replicates to
+            compare samples
+        callback: called with the list of records of every chunk of runs as
+            it arrives, e.g. IncrementalSobol.add, the sweep stops early when
+            it returns True
+        cache (ResultCache): if given, runs that are in the cache are not run
+            again, and new runs are added to it; with common_random_numbers
+            the seeds of a sample do not depend on its position in the sweep,
+            so the runs of a point are shared with other sweeps
+    """
+    state = sweep_state(model_cls, problem, param_values, model_reporters, max_steps, integer_params,
+                        fixed_parameters, seed, common_random_numbers, cache)
+    columns = list(problem['names']) + ['Run'] + sorted(model_reporters)
+
+    runs = range(len(param_values) * replicates)
+    if store is not None:
+        stored = store.keys()
+        runs = [run for run in runs if (run % len(param_values), run // len(param_values)) not in stored]
+
+    processes = processes or multiprocessing.cpu_count()
+    chunksize = chunksize or max(1, min(100, len(runs) // (processes * 4)))
+    chunks = [runs[start:start + chunksize] for start in range(0, len(runs), chunksize)]
+    tracker = Progress(len(runs)) if progress and runs else None
+
+    records = []
+
+    def collect(chunk_results):
+        chunk_records = [run_record(state, run, reports) for (run, reports) in chunk_results]
+        records.extend(chunk_records)
+        if store is not None and len(records) >= flush_every:
+            store.append(records)
+            records.clear()
+        if tracker:
+            tracker.update(len(chunk_results))
+        return callback is not None and callback(chunk_records)
+
+    if chunks:
+        with make_pool(state, processes) as pool:
+            for chunk_results in pool.imap_unordered(run_chunk, chunks):
+                if collect(chunk_results):
+                    break
+
+    if store is not None:
+        store.append(records)
+        return store.to_dataframe(columns)[columns]
+
+    records.sort(key=lambda record: record['Run'])
+    return pd.DataFrame(records, columns=columns)
@@ -0,0 +1,89 @@
+import json
+import os
+
+import numpy as np
+
+from terrain import DIRT, dirt, load_terrain
+
+
+def draw_density(alpha, beta, max_density, forest, rng=np.random):
+    """
+    Draws the initial density of every cell at once, beta(alpha, beta)
+    distributed up to max_density where forest is set and zero elsewhere.
+    """
+    return rng.beta(alpha, beta, forest.shape) * max_density * forest
+
+
+class LandscapeTemplate:
+    """
+    Initial landscape to build many models from: the terrain, the density of
+    every cell, the parameters it was drawn with and optionally the tree that
+    catches fire first. Models built with ForestFire(template=...) copy the
+    density field instead of drawing it, so they are cheap to build, and all
+    of them start from the same forest, for comparing strategies on a common
+    landscape.
+
+    A template saved to a directory is memory-mapped when loaded, and models
+    get a copy-on-write view of its density, so only the pages a fire
+    touches are ever copied.
+    """
+
+    def __init__(self, density, terrain=None, ignition=None, initial_density_dist_alpha=1.5,
+                 initial_density_dist_beta=10, max_density=555):
+        self.density = density
+        self.terrain = terrain if terrain is not None else dirt(*density.shape)
+        self.ignition = tuple(ignition) if ignition is not None else None
+        self.parameters = {"initial_density_dist_alpha": initial_density_dist_alpha,
+                           "initial_density_dist_beta": initial_density_dist_beta,
+                           "max_density": max_density}
+        self.path = None
+
+    @classmethod
+    def generate(cls, width=50, height=50, initial_density_dist_alpha=1.5, initial_density_dist_beta=10,
+                 max_density=555, terrain=None, ignite=False, seed=None):
+        """
+        Draws a new landscape, the terrain is all dirt unless a raster, .npy
+        file or image is given. With ignite, the tree that catches fire first
+        is drawn as well, otherwise every model draws its own.
+        """
+        rng = np.random.default_rng(seed)
+        terrain = load_terrain(terrain) if terrain is not None else dirt(width, height)
+        forest = terrain == DIRT
+        density = draw_density(initial_density_dist_alpha, initial_density_dist_beta, max_density, forest, rng)
+
+        ignition = None
+        if ignite and forest.any():
+            cells = np.flatnonzero(forest)
+            ignition = np.unravel_index(cells[rng.integers(len(cells))], forest.shape)
+            ignition = tuple(int(i) for i in ignition)
+
+        return cls(density, terrain, ignition, initial_density_dist_alpha, initial_density_dist_beta, max_density)
+
+    @property
+    def shape(self):
+        return self.density.shape
+
+    def get_density(self):
+        """
+        Returns a density field for a new model, which it may change freely.
+        """
+        if self.path is not None:
+            return np.load(os.path.join(self.path, "density.npy"), mmap_mode="c")
+        return self.density.copy()
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "density.npy"), np.asarray(self.density))
+        np.save(os.path.join(path, "terrain.npy"), np.asarray(self.terrain))
+        with open(os.path.join(path, "template.json"), "w") as f:
+            json.dump(dict(self.parameters, ignition=self.ignition), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "template.json")) as f:
+            parameters = json.load(f)
+
+        template = cls(np.load(os.path.join(path, "density.npy"), mmap_mode="r"),
+                       load_terrain(os.path.join(path, "terrain.npy")), **parameters)
+        template.path = path
+        return template
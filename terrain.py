@@ -1,31 +1,59 @@
-from mesa import Agent
+import numpy as np
 
-class Terrain(Agent):
-    def __init__(self, unique_id, model, color):
-        super().__init__(unique_id, model)
+# Terrain types of the raster. Trees only grow on dirt, so water and roads
+# act as firebreaks.
+DIRT = 0
+WATER = 1
+ROAD = 2
 
-        self.color = color
+colors = {DIRT: "brown",
+          WATER: "blue",
+          ROAD: "grey"}
 
-    def get_color(self):
-        return self.color
+# colours of the terrain types in image files
+image_colors = {DIRT: (150, 75, 0),
+                WATER: (0, 0, 255),
+                ROAD: (128, 128, 128)}
 
-    def get_portrayal(self):
-        portrayal = {"Shape": "rect",
-                 "Color": self.get_color(),
+
+def dirt(width, height):
+    return np.full((width, height), DIRT, dtype=np.uint8)
+
+
+def load_terrain(source):
+    """
+    Returns a terrain raster indexed [x, y] like the grid. The source is
+    either an array of terrain types, a .npy file holding one, or an image
+    file, whose pixels get the terrain type with the closest colour in
+    image_colors. The top row of an image is the top of the grid.
+    """
+    if isinstance(source, np.ndarray):
+        return source if source.dtype == np.uint8 else source.astype(np.uint8)
+
+    if str(source).endswith(".npy"):
+        # memory-mapped, so large rasters are only read where needed
+        raster = np.load(source, mmap_mode="r")
+        return raster if raster.dtype == np.uint8 else raster.astype(np.uint8)
+
+    from matplotlib.image import imread
+    image = imread(source)[..., :3]
+    if image.dtype != np.uint8:
+        image = image * 255
+
+    kinds = np.array(list(image_colors))
+    palette = np.array([image_colors[kind] for kind in kinds])
+    distance = ((image[:, :, None, :] - palette) ** 2).sum(axis=-1)
+    raster = kinds[distance.argmin(axis=-1)]
+
+    # image rows run from the top, grid rows from the bottom
+    return raster[::-1].T.astype(np.uint8)
+
+
+def get_portrayal(kind):
+    portrayal = {"Shape": "rect",
+                 "Color": colors[kind],
                  "Filled": "true",
                  "Layer": 0,
                  "w": 1.0,
                  "h": 1.0}
-        return portrayal
-
-class Dirt(Terrain):
-    def __init__(self, unique_id, model):
-        super().__init__(unique_id, model, "brown")
-
-class Water(Terrain):
-    def __init__(self, unique_id, model):
-        super().__init__(unique_id, model, "blue")
-
-class Road(Terrain):
-    def __init__(self, unique_id, model):
-        super().__init__(unique_id, model, "grey")
\ No newline at end of file
+    return portrayal
@@ -0,0 +1,177 @@
+import collections
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from sweep import make_pool, run_model, run_seed
+
+ThresholdResult = collections.namedtuple('ThresholdResult', ['threshold', 'interval', 'bracket', 'runs'])
+
+# state of the worker processes, set by init_worker
+worker = {}
+
+
+def init_worker(state):
+    worker.update(state)
+
+
+def run_task(task):
+    (value, seed) = task
+    parameters = dict(worker['fixed_parameters'], **{worker['parameter']: value})
+    return run_model(worker['model_cls'], parameters, worker['max_steps'], worker['model_reporters'], seed,
+                     worker['cache'])
+
+
+def wilson_interval(events, runs, confidence=0.95):
+    """
+    Wilson score interval on the probability of an event seen events times
+    in runs runs.
+    """
+    z = norm.ppf(0.5 + confidence / 2)
+    p = events / runs
+    centre = (p + z * z / (2 * runs)) / (1 + z * z / runs)
+    half = z * np.sqrt(p * (1 - p) / runs + z * z / (4 * runs * runs)) / (1 + z * z / runs)
+    return centre - half, centre + half
+
+
+def fit_logistic(x, y, ridge=1e-6, iterations=100):
+    """
+    Fits P(y) = 1 / (1 + exp(-(a + b x))) by Newton's method, returns (a, b)
+    and their covariance.
+    """
+    X = np.column_stack([np.ones_like(x), x])
+    beta = np.zeros(2)
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-X @ beta))
+        information = X.T @ (X * (p * (1 - p))[:, None]) + ridge * np.eye(2)
+        change = np.linalg.solve(information, X.T @ (y - p))
+        beta += change
+        if np.abs(change).max() < 1e-10:
+            break
+    p = 1 / (1 + np.exp(-X @ beta))
+    information = X.T @ (X * (p * (1 - p))[:, None]) + ridge * np.eye(2)
+    return beta, np.linalg.inv(information)
+
+
+def find_threshold(model_cls, parameter, bounds, model_reporters, event, level=0.5, fixed_parameters=None,
+                   integer=False, max_steps=50, min_replicates=8, max_replicates=256, xtol=None, confidence=0.95,
+                   seed=0, processes=None, cache=None):
+    """
+    Finds the value of a parameter where the probability of an event, e.g.
+    that the fire is not contained, crosses level, by noisy bisection. At
+    every point runs are added, doubling from min_replicates, until the
+    Wilson interval on the probability of the event lies on one side of
+    level, which halves the bracket. Points far from the threshold are
+    decided in a few runs. Bisection stops once the bracket is narrower than
+    xtol, or at a point that max_replicates runs cannot tell from the
+    threshold.
+
+    Replicate r is seeded the same at every point, so the runs of nearby
+    points differ mostly by the parameter, and with a cache repeated
+    searches reuse their runs.
+
+    The threshold and its confidence interval come from a logistic
+    regression of the event on the parameter over all runs. If the runs are
+    separated, no run with the event below some value and all above it or
+    the other way around, the interval is the gap between them.
+
+    Args:
+        model_cls: the model class, e.g. ForestFire
+        parameter (str): name of the parameter to search
+        bounds (tuple): bracket of the threshold, with the event more likely
+            at one end and less likely at the other
+        model_reporters (dict): reporters evaluated at the end of every run
+        event: function of the reports of a run, True if the event happened,
+            e.g. lambda reports: reports['Percentage lost'] > 50
+        level (float): probability of the event at the threshold
+        fixed_parameters (dict): other arguments for every model
+        integer (bool): the parameter takes integer values
+        xtol (float): width of the bracket to stop at, by default a
+            thousandth of bounds, 1 for integers
+        confidence (float): confidence level of the tests and the interval
+
+    Returns:
+        a ThresholdResult with the threshold, its confidence interval, the
+        final bracket and a DataFrame of all runs
+    """
+    state = {'model_cls': model_cls,
+             'parameter': parameter,
+             'fixed_parameters': fixed_parameters or {},
+             'max_steps': max_steps,
+             'model_reporters': model_reporters,
+             'cache': cache}
+    (low, high) = bounds
+    xtol = xtol if xtol is not None else (1 if integer else (high - low) / 1000)
+
+    records = []
+
+    def probability(pool, value):
+        """
+        Runs a point until its probability of the event is known to be
+        above or below level, returns +1, -1 or 0 if it stays undecided.
+        """
+        n = sum(record[parameter] == value for record in records)
+        target = min_replicates
+        while True:
+            target = min(max(target, n), max_replicates)
+            tasks = [(value, run_seed(seed, replicate)) for replicate in range(n, target)]
+            for (replicate, reports) in zip(range(n, target), pool.imap(run_task, tasks)):
+                records.append(dict({parameter: value, 'replicate': replicate, 'Event': bool(event(reports))},
+                                    **reports))
+            n = target
+
+            events = sum(record['Event'] for record in records if record[parameter] == value)
+            (lower, upper) = wilson_interval(events, n, confidence)
+            if lower > level:
+                return 1
+            if upper < level:
+                return -1
+            if n >= max_replicates:
+                return 0
+            target = 2 * n
+
+    processes = processes or multiprocessing.cpu_count()
+    with make_pool(state, processes, init_worker) as pool:
+        (side_low, side_high) = (probability(pool, low), probability(pool, high))
+        if side_low == side_high != 0:
+            raise ValueError(f"the event is {'more' if side_low > 0 else 'less'} likely than {level} "
+                             f"at both ends of {bounds}")
+
+        while high - low > xtol and (side_low or side_high):
+            middle = (low + high) // 2 if integer else (low + high) / 2
+            if middle in (low, high):
+                break
+            side = probability(pool, middle)
+            if side == 0:
+                break
+            # keep the half where the event crosses level, an undecided end
+            # is next to the threshold
+            if side != side_high:
+                (low, side_low) = (middle, side)
+            else:
+                (high, side_high) = (middle, side)
+
+    runs = pd.DataFrame(records)
+    x = runs[parameter].to_numpy(dtype=float)
+    y = runs['Event'].to_numpy(dtype=float)
+    (start, scale) = (bounds[0], bounds[1] - bounds[0])
+
+    below = x[y == 0]
+    above = x[y == 1]
+    if not len(below) or not len(above):
+        return ThresholdResult(None, (low, high), (low, high), runs)
+    if below.max() < above.min():
+        return ThresholdResult((below.max() + above.min()) / 2, (below.max(), above.min()), (low, high), runs)
+    if above.max() < below.min():
+        return ThresholdResult((above.max() + below.min()) / 2, (above.max(), below.min()), (low, high), runs)
+
+    # the threshold on the scale of bounds, by the delta method
+    ((a, b), covariance) = fit_logistic((x - start) / scale, y)
+    target = np.log(level / (1 - level))
+    estimate = (target - a) / b
+    gradient = np.array([-1 / b, -(target - a) / b ** 2])
+    spread = norm.ppf(0.5 + confidence / 2) * np.sqrt(gradient @ covariance @ gradient)
+    threshold = start + scale * estimate
+    return ThresholdResult(threshold, (threshold - scale * spread, threshold + scale * spread), (low, high), runs)
@@ -2,6 +2,8 @@ from model import ForestFire
 from agents import FireFighter
 import matplotlib.pyplot as plt
 import numpy as np
+from sweep import run_model, run_seed
+from cache import ResultCache
 
 # for the extinguish only
 
@@ -14,18 +16,24 @@ number_firefighters = 10
 extinguish_difficulty = 2
 firefighter_response_delay = 2
 
+# the percentage lost after every step, runs that stopped early because the
+# fire went out stay at their final value. Runs come from the cache if they
+# were done before
+cache = ResultCache('cache')
+reporters = {"Percentage lost trajectory":
+             lambda m: m.get_trajectory(simulation_time)["Percentage lost"].to_numpy()[1:]}
 
 data = np.zeros((num_samples, simulation_time, repetitions))
 for n in range(num_samples):
     for r in range(repetitions):
-        ff = ForestFire(fire_spread_param=fire_spread_param[n],
-                        firefighter_strategy=FireFighter.extinguish,
-                        number_firefighters=number_firefighters,
-                        extinguish_difficulty=extinguish_difficulty,
-                        firefighter_response_delay=firefighter_response_delay)
-        for t in range(simulation_time):
-            ff.step()
-            data[n][t][r] = ff.percentage_lost()
+        # the same seed for every spread parameter gives common random numbers
+        parameters = dict(fire_spread_param=fire_spread_param[n],
+                          firefighter_strategy=FireFighter.extinguish,
+                          number_firefighters=number_firefighters,
+                          extinguish_difficulty=extinguish_difficulty,
+                          firefighter_response_delay=firefighter_response_delay)
+        reports = run_model(ForestFire, parameters, simulation_time, reporters, run_seed(0, r), cache)
+        data[n, :, r] = reports["Percentage lost trajectory"]
 
 mean = np.zeros((num_samples, simulation_time))
 error = np.zeros((num_samples, simulation_time))
@@ -54,15 +62,14 @@ firefighter_response_delay = 2
 data = np.zeros((num_samples, simulation_time, repetitions))
 for n in range(num_samples):
     for r in range(repetitions):
-        ff = ForestFire(fire_spread_param=fire_spread_param[n],
-                        firefighter_strategy=FireFighter.firelines,
-                        number_firefighters=number_firefighters,
-                        cut_down_amount=cut_down_amount,
-                        fire_line_margin=fire_line_margin,
-                        firefighter_response_delay=firefighter_response_delay)
-        for t in range(simulation_time):
-            ff.step()
-            data[n][t][r] = ff.percentage_lost()
+        parameters = dict(fire_spread_param=fire_spread_param[n],
+                          firefighter_strategy=FireFighter.firelines,
+                          number_firefighters=number_firefighters,
+                          cut_down_amount=cut_down_amount,
+                          fire_line_margin=fire_line_margin,
+                          firefighter_response_delay=firefighter_response_delay)
+        reports = run_model(ForestFire, parameters, simulation_time, reporters, run_seed(0, r), cache)
+        data[n, :, r] = reports["Percentage lost trajectory"]
 
 mean = np.zeros((num_samples, simulation_time))
 error = np.zeros((num_samples, simulation_time))